@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Compare serial and parallel-segment WebM encoding.
+
+Writes a synthetic photo series to a temporary directory, encodes it with
+the serial writer and with 2, 4, ... processes, and prints frames/sec and
+speedup for each.
+
+    python3 benchmarks/parallel_webm.py [--frames 400] [--size 1280x720] [--processes 2 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timelapse_lib.create_animation import write_webm, write_webm_parallel  # noqa: E402
+
+
+def make_frames(directory, count, size):
+    """Write `count` JPEGs of a slowly panning noise texture."""
+    width, height = size
+    rng = np.random.default_rng(0)
+    texture = cv2.GaussianBlur((rng.random((height, width * 2, 3)) * 255).astype(np.uint8), (0, 0), 4)
+    paths = []
+    for i in range(count):
+        offset = int(i * width / count)
+        path = os.path.join(directory, f"photo_{i:06d}.jpg")
+        cv2.imwrite(path, texture[:, offset:offset + width])
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=400)
+    parser.add_argument("--size", default="1280x720", help="frame size WxH (default: 1280x720)")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=sorted({2, 4, os.cpu_count() or 1} - {1}))
+    args = parser.parse_args(argv)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    workdir = tempfile.mkdtemp(prefix="bench_webm_")
+    try:
+        image_files = make_frames(workdir, args.frames, size)
+        print(f"{args.frames} frames at {size[0]}x{size[1]}, {os.cpu_count()} CPUs")
+
+        runs = [("serial", lambda out: write_webm(image_files, out, fps=args.fps))]
+        for processes in args.processes:
+            runs.append((f"{processes} processes", lambda out, p=processes: write_webm_parallel(
+                image_files, out, fps=args.fps, processes=p)))
+
+        baseline = None
+        for label, run in runs:
+            output = os.path.join(workdir, f"out_{label.split()[0]}.webm")
+            started = time.perf_counter()
+            frames, _ = run(output)
+            elapsed = time.perf_counter() - started
+            baseline = baseline or elapsed
+            print(f"{label:>14}: {elapsed:7.2f}s  {frames / elapsed:7.1f} frames/sec  "
+                  f"x{baseline / elapsed:.2f}  {os.path.getsize(output) / 1e6:.1f} MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Guard the import-time budget of the CLI's capture path.
+
+Runs a fresh interpreter with `python -X importtime`, importing what a
+plain `timelapse_lib.cli` capture loads, and fails if it takes longer than
+the budget or pulls in a module the capture path should never need.
+
+    python3 benchmarks/startup.py [--budget-ms 800] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What `python -m timelapse_lib.cli` imports before it takes a photo
+CAPTURE_PATH = "import timelapse_lib.cli, timelapse_lib.capture, timelapse_lib.database"
+
+# Heavy packages that only other subcommands need
+FORBIDDEN = ("google.genai", "requests", "PIL", "matplotlib")
+
+
+def measure(code):
+    """Return ({module: cumulative microseconds}, total microseconds) for one run."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # column header
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        modules[name] = int(cumulative)
+        if depth == 1:
+            total += int(cumulative)
+    return modules, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=800, help="maximum median import time (default: 800)")
+    parser.add_argument("--runs", type=int, default=5, help="interpreter launches to take the median of (default: 5)")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list (default: 10)")
+    args = parser.parse_args(argv)
+
+    totals = []
+    modules = {}
+    for _ in range(max(1, args.runs)):
+        modules, total = measure(CAPTURE_PATH)
+        totals.append(total)
+    median_ms = statistics.median(totals) / 1000
+
+    print(f"Capture path imports: {median_ms:.0f} ms (median of {len(totals)}, budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = sorted(name for name in modules
+                    if any(name == f or name.startswith(f + ".") for f in FORBIDDEN))
+    if loaded:
+        print(f"❌ Capture path imports modules it doesn't need: {', '.join(loaded[:5])}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"❌ Import time over budget by {median_ms - args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("✅ Within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Benchmark the hot paths against synthetic photo corpora.
+
+Builds a corpus of synthetic JPEGs (a slowly panning texture with a
+day/night brightness cycle, one every 5 minutes up to now) for each
+requested frame count and resolution, plus a matching `timelapse.db`
+with an `ai_analysis` row per photo. Each hot path then runs in a fresh
+process against a scratch copy of the corpus database, and its wall
+time, throughput and peak RSS are written to a JSON file. Captures use
+a fake camera, so nothing needs a webcam or the network.
+
+    python3 benchmarks/suite.py [--frames 1000 10000] [--sizes 640x360 1280x720]
+                                [--only gif webm] [--corpus-dir DIR]
+                                [--output results.json] [--compare earlier.json]
+
+With --compare, results are matched with the earlier run's by benchmark,
+frame count and size, and the exit status is 1 if any got slower by more
+than --threshold (default 10%).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import multiprocessing
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CAPTURE_INTERVAL = timedelta(minutes=5)
+# Fixed-cost benchmarks don't need to touch the whole corpus
+STORE_PHOTOS = 1000
+LATEST_CALLS = 1000
+CAPTURES = 10
+
+BENCHMARKS = ("capture", "store_photo", "get_latest_photo", "gif", "webm", "chart_week", "chart_all")
+
+
+def _frame(texture, i, count, size):
+    """Return frame `i` of `count`: a window panning across `texture`, darker at night."""
+    width, height = size
+    offset = int(i * width / max(1, count))
+    hour = (i * CAPTURE_INTERVAL.total_seconds() / 3600) % 24
+    gain = 0.75 + 0.25 * np.cos((hour - 13) / 24 * 2 * np.pi)
+    return cv2.convertScaleAbs(texture[:, offset:offset + width], alpha=gain)
+
+
+def _texture(size, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur((rng.random((height, width * 2, 3)) * 255).astype(np.uint8), (0, 0), 4)
+
+
+class FakeClock(datetime):
+    """A datetime whose now() moves on by CAPTURE_INTERVAL per call, so every
+    benchmarked capture gets its own file name and database row."""
+
+    calls = 0
+
+    @classmethod
+    def now(cls, tz=None):
+        cls.calls += 1
+        return datetime(2000, 1, 1) + CAPTURE_INTERVAL * cls.calls
+
+
+class FakeVideoCapture:
+    """Stands in for cv2.VideoCapture, serving synthetic frames."""
+
+    size = (1280, 720)
+
+    def __init__(self, *args, **kwargs):
+        self._frame = _frame(_texture(self.size), 0, 1, self.size)
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0.0
+
+    def grab(self):
+        return True
+
+    def read(self):
+        return True, self._frame.copy()
+
+    def release(self):
+        pass
+
+
+def corpus_ready(directory):
+    return os.path.exists(os.path.join(directory, "corpus.json"))
+
+
+def build_corpus(directory, count, size):
+    """Write `count` synthetic photos and a matching database under `directory`."""
+    os.environ.update(PHOTO_PATH=os.path.join(directory, "photos"), DB_PATH=os.path.join(directory, "timelapse.db"))
+    from timelapse_lib.database import close_db, get_db, rebuild_rollups, store_photos_bulk
+    from timelapse_lib.storage import shard_dir
+
+    texture = _texture(size)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - CAPTURE_INTERVAL * count
+    scores = random.Random(0)
+    rows = []
+    started = time.perf_counter()
+    for i in range(count):
+        captured_at = start + CAPTURE_INTERVAL * i
+        path = os.path.join(shard_dir(captured_at), f"photo_{captured_at:%Y-%m-%d_%H-%M-%S}.jpg")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        cv2.imwrite(path, _frame(texture, i, count, size))
+        rows.append((path, captured_at, os.path.getsize(path), size[0], size[1], None))
+    store_photos_bulk(rows)
+
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "INSERT INTO ai_analysis (photo_id, captured_at, description, plant_score) VALUES (?, ?, ?, ?)",
+            ((photo_id, captured_at, f"Synthetic plant, score {score}", score)
+             for photo_id, captured_at, score in ((row[0], row[1], scores.randint(40, 95))
+                                                  for row in conn.execute("SELECT id, captured_at FROM photos ORDER BY id")))
+        )
+    rebuild_rollups()
+    close_db()
+    with open(os.path.join(directory, "corpus.json"), "w") as f:
+        json.dump({"frames": count, "size": list(size), "end": end.isoformat()}, f)
+    print(f"Built {count} frame {size[0]}x{size[1]} corpus in {time.perf_counter() - started:.1f}s")
+
+
+def _run(name, corpus, scratch, size):
+    """Run one benchmark in this (fresh) process. Returns (seconds, items, peak RSS in MB)."""
+    db_path = os.path.join(scratch, "timelapse.db")
+    if name not in ("capture", "store_photo"):
+        shutil.copy(os.path.join(corpus, "timelapse.db"), db_path)
+    os.environ.update(
+        PHOTO_PATH=os.path.join(corpus if name != "capture" else scratch, "photos"),
+        DB_PATH=db_path, GIF_PATH=scratch, VIDEO_PATH=scratch, PROXY_PATH=os.path.join(scratch, "proxies"),
+    )
+
+    if name == "capture":
+        import types
+        from timelapse_lib import capture
+        FakeVideoCapture.size = size
+        cv2.VideoCapture = FakeVideoCapture
+        capture.datetime = types.SimpleNamespace(datetime=FakeClock)
+
+        def work():
+            for _ in range(CAPTURES):
+                capture.capture_photo(warmup_seconds=1)
+            return CAPTURES
+    elif name == "store_photo":
+        from timelapse_lib.database import store_photo
+        paths = sorted(
+            os.path.join(root, f) for root, _, files in os.walk(os.path.join(corpus, "photos")) for f in files
+        )[:STORE_PHOTOS]
+
+        def work():
+            for path in paths:
+                store_photo(path, width=size[0], height=size[1])
+            return len(paths)
+    elif name == "get_latest_photo":
+        from timelapse_lib.capture import get_latest_photo
+
+        def work():
+            for _ in range(LATEST_CALLS):
+                get_latest_photo()
+            return LATEST_CALLS
+    elif name in ("gif", "webm"):
+        from timelapse_lib.create_animation import create_gif, create_webm
+
+        def work():
+            if name == "gif":
+                create_gif(size=(size[0] // 2, size[1] // 2))
+            else:
+                create_webm()
+    else:
+        from timelapse_lib.post_plant_score import generate_plant_score_chart
+        days = 7 if name == "chart_week" else None
+
+        def work():
+            generate_plant_score_chart(days=days, output_path=os.path.join(scratch, "chart.png"))
+            return 1
+
+    started = time.perf_counter()
+    items = work()
+    elapsed = time.perf_counter() - started
+    if items is None:
+        # Frames actually rendered, after filtering (signatures are cached by now)
+        from timelapse_lib.create_animation import list_photo_files
+        items = len(list_photo_files())
+
+    from timelapse_lib.create_animation import _peak_rss_mb
+    return elapsed, items, _peak_rss_mb()
+
+
+def run_benchmark(name, corpus, size):
+    """Run one benchmark in a fresh process, so peak RSS is its own."""
+    scratch = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return pool.submit(_run, name, corpus, scratch, size).result()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, earlier, threshold):
+    """Print each result against the matching earlier one. Returns the number of regressions."""
+    def key(result):
+        return result["name"], result["frames"], tuple(result["size"])
+
+    previous = {key(result): result for result in earlier["results"]}
+    regressions = 0
+    print(f"\nCompared with {earlier['meta'].get('revision') or 'earlier run'} ({earlier['meta']['started']})")
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        change = result["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        slower = change > threshold
+        regressions += slower
+        print(f"{'⚠️' if slower else '  '} {_label(result):<36} {old['seconds']:8.3f}s -> {result['seconds']:8.3f}s "
+              f"({change:+6.1%})  RSS {old['peak_rss_mb']:6.0f} -> {result['peak_rss_mb']:6.0f} MB")
+    return regressions
+
+
+def _label(result):
+    return f"{result['name']} {result['frames']}@{result['size'][0]}x{result['size'][1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, nargs="+", default=[1000],
+                        help="corpus sizes in frames, e.g. 1000 10000 100000 (default: 1000)")
+    parser.add_argument("--sizes", nargs="+", default=["640x360", "1280x720"],
+                        help="corpus resolutions WxH (default: 640x360 1280x720)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--corpus-dir", help="keep corpora here and reuse them on later runs (default: temporary)")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown that counts as a regression with --compare (default: 0.10)")
+    args = parser.parse_args(argv)
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes]
+
+    started = datetime.now()
+    meta = {
+        "started": started.isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    corpus_root = args.corpus_dir or tempfile.mkdtemp(prefix="bench_corpus_")
+    results = []
+    try:
+        for count in args.frames:
+            for size in sizes:
+                corpus = os.path.join(corpus_root, f"{count}_{size[0]}x{size[1]}")
+                if not corpus_ready(corpus):
+                    shutil.rmtree(corpus, ignore_errors=True)
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                        pool.submit(build_corpus, corpus, count, size).result()
+                for name in args.only:
+                    seconds, items, peak_rss_mb = run_benchmark(name, corpus, size)
+                    result = {
+                        "name": name, "frames": count, "size": list(size), "seconds": round(seconds, 4),
+                        "items": items, "per_second": round(items / seconds, 2) if seconds else None,
+                        "peak_rss_mb": round(peak_rss_mb, 1),
+                    }
+                    results.append(result)
+                    print(f"{_label(result):<36} {seconds:8.3f}s  {result['per_second']:10.1f}/s  "
+                          f"{result['peak_rss_mb']:6.0f} MB")
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+
+from timelapse_lib import config, database
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Point every storage setting at `tmp_path`, ignoring .env and the environment."""
+    monkeypatch.setattr(config, "DOTENV_PATH", str(tmp_path / ".env"))
+    monkeypatch.setattr(config, "_overrides", {})
+    monkeypatch.setattr(config, "_cached", None)
+    for env_name, _ in config.ENV_VARS.values():
+        monkeypatch.delenv(env_name, raising=False)
+    config.override_settings(
+        photos_dir=str(tmp_path / "photos"),
+        gifs_dir=str(tmp_path / "gifs"),
+        videos_dir=str(tmp_path / "videos"),
+        proxies_dir=str(tmp_path / "proxies"),
+        spool_dir=str(tmp_path / "spool"),
+        db_path=str(tmp_path / "timelapse.db"),
+        frame_filter=False,
+        metrics=False,
+    )
+    yield tmp_path
+    database.close_db()
+
+
+def make_frame(width, height, seed=0):
+    """Return a textured BGR frame that survives JPEG encoding and frame filtering."""
+    rng = np.random.default_rng(seed)
+    noise = (rng.random((height, width, 3)) * 255).astype(np.uint8)
+    return cv2.GaussianBlur(noise, (0, 0), 2)
+
+
+def add_photo(captured_at, width=320, height=240, photos_dir=None, camera=0):
+    """Write a photo into the sharded layout and index it. Returns (photo_id, path)."""
+    from timelapse_lib.storage import shard_dir
+
+    directory = shard_dir(captured_at, photos_dir, camera=camera)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"photo_{captured_at:%Y-%m-%d_%H-%M-%S}.jpg")
+    cv2.imwrite(path, make_frame(width, height, seed=int(captured_at.timestamp())))
+    return database.store_photo(path, width=width, height=height), path
+
+
+def days_ago(days, minutes=0):
+    return (datetime.now() - timedelta(days=days, minutes=minutes)).replace(microsecond=0)
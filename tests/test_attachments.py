@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from timelapse_lib import attachments
+from timelapse_lib.create_animation import create_gif
+
+from conftest import add_photo, days_ago
+
+
+@pytest.fixture
+def gif(workspace):
+    for i in range(12):
+        add_photo(days_ago(1, minutes=5 * i))
+    return create_gif()
+
+
+def test_gif_copy_is_rendered_again_until_it_fits(gif, monkeypatch):
+    budget = os.path.getsize(gif) // 3
+    # An optimistic size model makes the first copy overshoot the budget
+    monkeypatch.setattr(attachments, "SAFETY", 1.5)
+
+    attachment = attachments.prepare_gif_attachment(gif, budget=budget)
+    assert attachment != gif
+    assert os.path.getsize(attachment) <= budget
+
+
+def test_gif_that_cannot_fit_raises(gif):
+    with pytest.raises(ValueError):
+        attachments.prepare_gif_attachment(gif, budget=100)
+    assert not os.path.exists(attachments._attachment_path(gif))
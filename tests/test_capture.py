@@ -0,0 +1,60 @@
+import os
+
+import cv2
+import pytest
+
+from timelapse_lib import capture, config
+from timelapse_lib.create_animation import create_gif
+from timelapse_lib.database import get_db
+
+from conftest import make_frame
+
+
+class FakeVideoCapture:
+    """Stands in for cv2.VideoCapture, serving the same frame forever."""
+
+    def __init__(self, *args, **kwargs):
+        self.frame = make_frame(64, 48)
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        return True, self.frame.copy()
+
+    def grab(self):
+        return True
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def fake_camera(monkeypatch):
+    monkeypatch.setattr(cv2, "VideoCapture", FakeVideoCapture)
+
+
+def _cameras():
+    return sorted(row[0] for row in get_db().execute("SELECT camera FROM photos"))
+
+
+def test_single_camera_uses_series_zero(workspace, fake_camera):
+    config.override_settings(camera_device=2, warmup_seconds=0.2)
+
+    paths = capture.capture_photos()
+    assert list(paths) == [2]
+    assert os.path.relpath(paths[2], workspace / "photos").split(os.sep)[0] != "cam2"
+    assert _cameras() == [0]
+    assert create_gif()
+
+
+def test_several_cameras_get_their_own_series(workspace, fake_camera):
+    config.override_settings(camera_devices=(1, 2), warmup_seconds=0.2)
+
+    paths = capture.capture_photos()
+    assert sorted(paths) == [1, 2]
+    assert os.path.relpath(paths[2], workspace / "photos").split(os.sep)[0] == "cam2"
+    assert _cameras() == [1, 2]
+    assert config.get_camera() == 1
+    assert create_gif()
+    assert create_gif(camera=2).endswith(".gif")
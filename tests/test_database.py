@@ -0,0 +1,19 @@
+import os
+
+from timelapse_lib.database import get_indexed_paths, reconcile_photos
+
+from conftest import add_photo, days_ago
+
+
+def test_reconcile_keeps_ingested_photos(workspace):
+    # Photos indexed in place outside photos/, as --ingest does
+    archive = workspace / "archive"
+    _, ingested = add_photo(days_ago(400), photos_dir=str(archive))
+    _, gone = add_photo(days_ago(300), photos_dir=str(archive))
+    _, kept = add_photo(days_ago(1))
+    _, removed = add_photo(days_ago(2))
+    os.remove(gone)
+    os.remove(removed)
+
+    assert reconcile_photos(str(workspace / "photos")) == (0, 2)
+    assert get_indexed_paths() == {ingested, kept}
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from timelapse_lib import config, discord_webhook
+
+
+class StubDiscord(ThreadingHTTPServer):
+    """A local webhook endpoint answering with scripted (status, headers) replies."""
+
+    daemon_threads = True
+
+    def __init__(self, replies=()):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.replies = list(replies)  # popped per request; 204 once empty
+        self.lock = threading.Lock()
+        self.posts = []  # (time, status, form fields or raw body)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+    def delivered(self):
+        return [body for _, status, body in self.posts if status < 300]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            status, headers = server.replies.pop(0) if server.replies else (204, {})
+            if self.headers["Content-Type"].startswith("application/x-www-form-urlencoded"):
+                body = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            server.posts.append((time.monotonic(), status, body))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(workspace, monkeypatch):
+    servers = []
+
+    def start(replies=()):
+        server = StubDiscord(replies)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        config.override_settings(photo_webhook_url=server.url, ai_webhook_url=server.url)
+        return server
+
+    # Tests drain the spool themselves instead of through the sender thread
+    monkeypatch.setattr(discord_webhook, "_ensure_sender", lambda: None)
+    monkeypatch.setattr(discord_webhook, "_session", None)
+    monkeypatch.setattr(discord_webhook, "MIN_BACKOFF", 0.05)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _failed():
+    return sorted(os.listdir(discord_webhook._failed_dir()))
+
+
+def test_rate_limited_post_waits_for_retry_after(stub):
+    server = stub(replies=[(429, {"Retry-After": "0.3"})])
+    discord_webhook.enqueue_message("photo", "hello")
+
+    discord_webhook._drain()
+    assert [status for _, status, _ in server.posts] == [429, 204]
+    assert server.posts[1][0] - server.posts[0][0] >= 0.3
+    assert server.delivered() == [{"content": "hello"}]
+    assert discord_webhook._spooled() == [] and _failed() == []
+
+
+def test_server_errors_are_retried_with_backoff(stub):
+    server = stub(replies=[(502, {}), (503, {})])
+    discord_webhook.enqueue_message("ai", "report")
+
+    discord_webhook._drain()
+    times = [t for t, _, _ in server.posts]
+    assert [status for _, status, _ in server.posts] == [502, 503, 204]
+    # 0.05s after the first failure, then twice that
+    assert times[1] - times[0] >= 0.05
+    assert times[2] - times[1] >= 0.1
+    assert server.delivered() == [{"content": "report"}]
+
+
+def test_rejected_post_is_moved_to_failed(stub):
+    server = stub(replies=[(400, {})])
+    discord_webhook.enqueue_message("photo", "bad")
+    discord_webhook.enqueue_message("ai", "good")
+
+    discord_webhook._drain()
+    assert [status for _, status, _ in server.posts] == [400, 204]
+    assert server.delivered() == [{"content": "good"}]
+    assert discord_webhook._spooled() == []
+    assert len(_failed()) == 1
+
+
+def test_unreadable_attachment_is_moved_to_failed(stub, workspace):
+    server = stub()
+    # Opening a directory raises IsADirectoryError, an OSError
+    discord_webhook.enqueue_message("photo", "broken", file_path=str(workspace))
+    discord_webhook.enqueue_message("ai", "next")
+
+    discord_webhook._drain()
+    assert server.delivered() == [{"content": "next"}]
+    assert len(_failed()) == 1
+
+
+def test_spooled_messages_survive_a_restart(stub, monkeypatch):
+    # Queued while Discord was unreachable, then the process exited
+    config.override_settings(photo_webhook_url="http://127.0.0.1:9/webhook")
+    discord_webhook.enqueue_message("photo", "first")
+    discord_webhook.enqueue_message("photo", "second")
+    assert len(discord_webhook._spooled()) == 2
+
+    # The next run starts with nothing in memory but the spool on disk
+    monkeypatch.setattr(discord_webhook, "_session", None)
+    server = stub()
+    discord_webhook._drain()
+    assert server.delivered() == [{"content": "first\nsecond"}]
+    assert discord_webhook._spooled() == []
@@ -0,0 +1,22 @@
+from timelapse_lib import config, frame_filter
+from timelapse_lib.database import get_photos_in_range
+
+from conftest import add_photo, days_ago
+
+
+def test_unreadable_frames_are_decoded_once(workspace, monkeypatch):
+    config.override_settings(frame_filter=True)
+    for i in range(3):
+        add_photo(days_ago(1, minutes=5 * i), width=64, height=48)
+    _, broken = add_photo(days_ago(1, minutes=30))
+    with open(broken, "wb") as f:
+        f.write(b"not a jpeg")
+
+    rows = get_photos_in_range()
+    assert broken not in [row["photo_path"] for row in frame_filter.select_frames(rows)]
+
+    decoded = []
+    compute = frame_filter.compute_signature
+    monkeypatch.setattr(frame_filter, "compute_signature", lambda path: decoded.append(path) or compute(path))
+    assert broken not in [row["photo_path"] for row in frame_filter.select_frames(rows)]
+    assert decoded == []
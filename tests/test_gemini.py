@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from timelapse_lib import config, gemini
+from timelapse_lib.database import get_db
+
+from conftest import add_photo, days_ago
+
+REPLY = {"plant_score": 80, "plant_care": "Water weekly"}
+
+
+class StubGemini(ThreadingHTTPServer):
+    """A local generateContent endpoint answering with scripted statuses."""
+
+    daemon_threads = True
+
+    def __init__(self, statuses=(), delay=0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.statuses = list(statuses)  # popped per request; 200 once empty
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.started = []
+        self.in_flight = self.max_in_flight = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.started.append(time.monotonic())
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.statuses.pop(0) if server.statuses else 200
+        time.sleep(server.delay)
+        if status == 200:
+            body = {"candidates": [{"content": {"role": "model", "parts": [{"text": json.dumps(REPLY)}]}}]}
+        else:
+            body = {"error": {"code": status, "message": "stubbed error", "status": "STUBBED"}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with server.lock:
+            server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(workspace, monkeypatch):
+    servers = []
+
+    def start(statuses=(), delay=0.0):
+        server = StubGemini(statuses, delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        config.override_settings(gemini_api_key="test-key", gemini_base_url=server.url)
+        return server
+
+    monkeypatch.setattr(gemini, "_client", None)
+    monkeypatch.setattr(gemini, "RETRY_DELAY", 0.01)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _add_photos(count):
+    return [add_photo(days_ago(1, minutes=5 * i), width=64, height=48)[0] for i in range(count)]
+
+
+def _analysed():
+    return get_db().execute("SELECT COUNT(*) FROM ai_analysis").fetchone()[0]
+
+
+def test_rate_limited_request_is_retried(stub):
+    server = stub(statuses=[429])
+    _add_photos(2)
+
+    assert gemini.analyse_pending(concurrency=1, requests_per_minute=6000) == (2, 0)
+    assert len(server.started) == 3
+    assert _analysed() == 2
+
+
+def test_bad_request_is_not_retried(stub):
+    server = stub(statuses=[400, 400])
+    _add_photos(2)
+
+    assert gemini.analyse_pending(concurrency=1, requests_per_minute=6000) == (0, 2)
+    assert len(server.started) == 2
+    assert _analysed() == 0
+
+
+def test_missing_file_fails_without_requests(stub):
+    server = stub()
+    photo_id = _add_photos(1)[0]
+    conn = get_db()
+    with conn:
+        path = conn.execute("SELECT photo_path FROM photos WHERE id = ?", (photo_id,)).fetchone()[0]
+        conn.execute("UPDATE photos SET content_hash = NULL")
+    os.remove(path)
+
+    started = time.monotonic()
+    assert gemini.analyse_pending(concurrency=1, requests_per_minute=6000) == (0, 1)
+    assert time.monotonic() - started < 1
+    assert server.started == []
+
+
+def test_storage_failure_counts_as_failed(stub, monkeypatch):
+    stub()
+    _add_photos(1)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(gemini, "store_analysis", fail)
+    assert gemini.analyse_pending(concurrency=1, requests_per_minute=6000) == (0, 1)
+
+
+def test_concurrency_limit(stub):
+    server = stub(delay=0.3)
+    _add_photos(6)
+
+    assert gemini.analyse_pending(concurrency=2, requests_per_minute=6000) == (6, 0)
+    assert server.max_in_flight == 2
+
+
+def test_rate_limit(stub):
+    server = stub()
+    _add_photos(6)
+
+    assert gemini.analyse_pending(concurrency=6, requests_per_minute=600) == (6, 0)
+    # 600/min allows one request every 100 ms, whatever the concurrency
+    assert server.started[-1] - server.started[0] >= 0.45
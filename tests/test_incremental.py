@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from timelapse_lib import incremental
+from timelapse_lib.incremental import render_gif_incremental, render_webm_incremental
+
+from conftest import add_photo, days_ago
+
+
+def _outputs(workspace):
+    return sorted(name for name in os.listdir(workspace / "gifs") if name.endswith(".gif"))
+
+
+def _manifest(workspace):
+    with open(workspace / "gifs" / "segments" / "manifest.json") as f:
+        return json.load(f)
+
+
+def test_keeps_one_output_and_merges_segments(workspace, monkeypatch):
+    monkeypatch.setattr(incremental, "MAX_SEGMENTS", 2)
+    photos = 0
+    for run in range(5):
+        for i in range(2):
+            add_photo(days_ago(5 - run, minutes=5 * i), width=64, height=48)
+            photos += 1
+        output = render_gif_incremental()
+        assert _outputs(workspace) == [os.path.basename(output)]
+        assert len(_manifest(workspace)["segments"]) <= 2
+        with Image.open(output) as gif:
+            assert gif.n_frames == photos
+
+    segment_files = [name for name in os.listdir(workspace / "gifs" / "segments") if name.endswith(".gif")]
+    assert sorted(segment_files) == sorted(s["file"] for s in _manifest(workspace)["segments"])
+
+
+def test_rebuild_removes_previous_output(workspace):
+    add_photo(days_ago(1), width=64, height=48)
+    first = render_gif_incremental()
+    # Outputs are named to the second, so give the first one a name of its own
+    os.rename(first, first.replace(".gif", "_old.gif"))
+    manifest = _manifest(workspace)
+    manifest["output"] = first.replace(".gif", "_old.gif")
+    with open(workspace / "gifs" / "segments" / "manifest.json", "w") as f:
+        json.dump(manifest, f)
+
+    second = render_gif_incremental(rebuild=True)
+    assert _outputs(workspace) == [os.path.basename(second)]
+
+
+def test_photos_indexed_late_are_encoded(workspace):
+    add_photo(days_ago(1), width=64, height=48)
+    render_gif_incremental()
+    # Backfilled with an earlier capture time than what was already encoded
+    add_photo(days_ago(3), width=64, height=48)
+
+    with Image.open(render_gif_incremental()) as gif:
+        assert gif.n_frames == 2
+
+
+def test_stride_applies_to_filtered_frames(workspace):
+    from timelapse_lib import config
+
+    config.override_settings(frame_filter=True, gif_stride=2)
+    for i in range(4):
+        add_photo(days_ago(1, minutes=5 * i), width=64, height=48)
+    _, broken = add_photo(days_ago(1, minutes=1))
+    with open(broken, "wb") as f:
+        f.write(b"not a jpeg")
+    render_gif_incremental()
+    for i in range(2):
+        add_photo(days_ago(0, minutes=5 * i + 5), width=64, height=48)
+
+    # Every other one of the 6 readable frames, as a full render picks them
+    with Image.open(render_gif_incremental()) as gif:
+        assert gif.n_frames == 3
+
+
+def test_incremental_webm_needs_ffmpeg(workspace, monkeypatch):
+    add_photo(days_ago(1), width=64, height=48)
+    monkeypatch.setattr(incremental.shutil, "which", lambda name: None)
+
+    with pytest.raises(RuntimeError, match="ffmpeg"):
+        render_webm_incremental()
+    assert not os.path.exists(workspace / "videos" / "segments")
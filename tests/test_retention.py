@@ -0,0 +1,82 @@
+import os
+
+import cv2
+from PIL import Image
+
+from timelapse_lib import config, retention
+from timelapse_lib.create_animation import create_gif, create_webm
+from timelapse_lib.database import get_db, get_plant_score_rollups, get_plant_score_series, store_analysis
+from timelapse_lib.retention import run_retention
+
+from conftest import add_photo, days_ago
+
+
+def _archived(photo_id):
+    return get_db().execute("SELECT archived_at FROM photos WHERE id = ?", (photo_id,)).fetchone()[0]
+
+
+def test_photos_past_archive_days_are_archived_by_default(workspace):
+    old_id, old_path = add_photo(days_ago(90))
+    recent_id, recent_path = add_photo(days_ago(10))
+
+    config.override_settings(retention_min_free_gb=0)
+    assert run_retention() == (1, 0)
+    assert _archived(old_id) is not None
+    assert Image.open(old_path).size == (160, 120)
+    assert _archived(recent_id) is None
+    assert Image.open(recent_path).size == (320, 240)
+
+
+def test_low_space_archives_before_deleting_and_keeps_analyses(workspace, monkeypatch):
+    monkeypatch.setattr(retention, "free_space_gb", lambda: 0.0)
+    old_id, old_path = add_photo(days_ago(20))
+    store_analysis(old_id, "Healthy, score 80", plant_score=80)
+    middle_id, middle_path = add_photo(days_ago(10))
+    recent_id, recent_path = add_photo(days_ago(2))
+
+    config.override_settings(retention_min_free_gb=1, retention_keep_days=5)
+    # Everything is archived first; only archived photos older than 5 days are deleted
+    assert run_retention(batch_size=10) == (3, 2)
+    assert not os.path.exists(old_path) and not os.path.exists(middle_path)
+    assert _archived(recent_id) is not None
+    assert Image.open(recent_path).size == (160, 120)
+
+    conn = get_db()
+    assert conn.execute("SELECT COUNT(*) FROM photos").fetchone()[0] == 1
+    assert [tuple(row) for row in conn.execute("SELECT photo_id, plant_score FROM ai_analysis")] == [(None, 80)]
+    assert [row["mean_score"] for row in get_plant_score_rollups("day")] == [80]
+    assert [score for _, score in get_plant_score_series()] == [80]
+
+
+def test_retention_leaves_ingested_files_alone(workspace):
+    outside = workspace / "archive"
+    ingested_id, ingested_path = add_photo(days_ago(90), photos_dir=str(outside))
+    photo_id, path = add_photo(days_ago(90, minutes=5))
+
+    config.override_settings(retention_archive_days=30, retention_min_free_gb=0)
+    assert run_retention() == (1, 0)
+    assert _archived(photo_id) is not None
+    assert Image.open(path).size == (160, 120)
+    assert _archived(ingested_id) is None
+    assert Image.open(ingested_path).size == (320, 240)
+
+
+def test_renders_keep_full_size_across_archived_photos(workspace):
+    old = [add_photo(days_ago(60, minutes=5 * i))[1] for i in range(3)]
+    recent = [add_photo(days_ago(1, minutes=5 * i))[1] for i in range(3)]
+
+    config.override_settings(retention_archive_days=30, retention_min_free_gb=0)
+    assert run_retention() == (3, 0)
+    assert all(Image.open(path).size == (160, 120) for path in old)
+    assert all(Image.open(path).size == (320, 240) for path in recent)
+
+    with Image.open(create_gif()) as gif:
+        assert gif.size == (320, 240)
+        assert gif.n_frames == 6
+
+    cap = cv2.VideoCapture(create_webm(processes=1))
+    try:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+    assert size == (320, 240)
@@ -0,0 +1,43 @@
+import pytest
+
+from timelapse_lib import config, incremental, scheduler
+
+
+def _job(jobs, name):
+    return next(job for job in jobs if job.name == name)
+
+
+def test_render_keeps_going_after_a_camera_fails(workspace, monkeypatch):
+    config.override_settings(camera_devices=(0, 1))
+    rendered = []
+
+    def render_gif(camera):
+        if camera == 0:
+            raise RuntimeError("broken")
+        rendered.append(("gif", camera))
+
+    monkeypatch.setattr(incremental, "render_gif_incremental", render_gif)
+    monkeypatch.setattr(incremental, "render_webm_incremental", lambda camera: rendered.append(("webm", camera)))
+    monkeypatch.setattr(scheduler.shutil, "which", lambda name: None)
+    jobs = scheduler.default_jobs()
+    try:
+        with pytest.raises(RuntimeError, match="1 renders failed"):
+            _job(jobs, "render").run()
+    finally:
+        _job(jobs, "capture").close()
+    # Without ffmpeg only GIFs are rendered
+    assert rendered == [("gif", 1)]
+
+
+def test_ai_batch_is_limited(workspace, monkeypatch):
+    from timelapse_lib import gemini
+
+    config.override_settings(ai_batch_limit=5)
+    calls = []
+    monkeypatch.setattr(gemini, "analyse_pending", lambda limit=None: calls.append(limit) or (0, 0))
+    jobs = scheduler.default_jobs()
+    try:
+        _job(jobs, "ai_batch").run()
+    finally:
+        _job(jobs, "capture").close()
+    assert calls == [5]
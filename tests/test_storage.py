@@ -0,0 +1,46 @@
+import os
+
+import cv2
+
+from timelapse_lib.database import get_indexed_paths, store_photo
+from timelapse_lib.storage import migrate_to_sharded, shard_dir
+
+from conftest import add_photo, days_ago, make_frame
+
+
+def _flat_photo(photos_dir, captured_at):
+    os.makedirs(photos_dir, exist_ok=True)
+    path = os.path.join(photos_dir, f"photo_{captured_at:%Y-%m-%d_%H-%M-%S}.jpg")
+    cv2.imwrite(path, make_frame(32, 24))
+    store_photo(path)
+    return path
+
+
+def test_migrate_moves_flat_photos_in_batches(workspace):
+    photos_dir = str(workspace / "photos")
+    times = [days_ago(3, minutes=5 * i) for i in range(5)]
+    flat = [_flat_photo(photos_dir, captured_at) for captured_at in times]
+    os.remove(flat.pop())  # missing files are left to --reconcile
+    _, sharded = add_photo(days_ago(1))
+    _, outside = add_photo(days_ago(2), photos_dir=str(workspace / "archive"))
+
+    assert migrate_to_sharded(batch_size=2) == (4, 1)
+    expected = {os.path.join(shard_dir(captured_at, photos_dir), os.path.basename(path))
+                for path, captured_at in zip(flat, times)}
+    assert all(os.path.exists(path) for path in expected)
+    assert {sharded, outside} | expected <= get_indexed_paths()
+
+    assert migrate_to_sharded(batch_size=2) == (0, 1)
+
+
+def test_migrate_indexes_and_moves_unindexed_flat_files(workspace):
+    photos_dir = str(workspace / "photos")
+    captured_at = days_ago(3)
+    os.makedirs(photos_dir)
+    path = os.path.join(photos_dir, f"photo_{captured_at:%Y-%m-%d_%H-%M-%S}.jpg")
+    cv2.imwrite(path, make_frame(32, 24))
+
+    assert migrate_to_sharded() == (1, 0)
+    moved = os.path.join(shard_dir(captured_at, photos_dir), os.path.basename(path))
+    assert not os.path.exists(path) and os.path.exists(moved)
+    assert get_indexed_paths() == {moved}
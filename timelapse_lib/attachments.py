@@ -0,0 +1,220 @@
+"""Fit rendered timelapses into Discord's attachment size limit.
+
+The full-quality render stays on disk. When it is too large to attach,
+a smaller copy is rendered in a single pass with parameters chosen from
+a size model calibrated on the full render: its bytes per pixel per
+frame tell us how large any resolution/frame-count combination will be.
+"""
+import math
+import mmap
+import os
+import shutil
+import subprocess
+
+import cv2
+
+from .config import get_settings
+from .create_animation import list_photo_files, write_gif, write_webm
+
+# Leave headroom for the size model's error and multipart overhead
+SAFETY = 0.85
+# Don't shrink below this width; drop frames instead
+MIN_WIDTH = 480
+# Below this many bits per pixel per frame, VP9 output turns to mush
+MIN_VIDEO_BPP = 0.04
+# Renders tried before giving up on fitting the budget, and how far
+# below the last miss each retry aims
+MAX_ATTEMPTS = 3
+RETRY_MARGIN = 0.9
+
+
+def attachment_budget():
+    """Return the attachment size budget in bytes."""
+    return int(get_settings().discord_max_attachment_mb * 1024 * 1024)
+
+
+def _attachment_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}_discord{ext}"
+
+
+def _fit(render, path, output_path, budget):
+    """Call `render(target)` with shrinking byte targets until `output_path` fits `budget`.
+
+    The size model is only an estimate (noisy footage compresses worse
+    at small sizes), so each overshoot scales the next target by how far
+    the last render missed. Raises ValueError if nothing fits.
+    """
+    target = budget
+    for _ in range(MAX_ATTEMPTS):
+        render(target)
+        size_bytes = os.path.getsize(output_path)
+        if size_bytes <= budget:
+            return output_path
+        print(f"⚠️ Discord copy is {size_bytes / 1e6:.1f} MB, over the "
+              f"{budget / 1e6:.1f} MB limit; rendering a smaller one")
+        target *= RETRY_MARGIN * budget / size_bytes
+    os.remove(output_path)
+    raise ValueError(f"Could not fit {os.path.basename(path)} into {budget / 1e6:.1f} MB for Discord")
+
+
+def _skip_sub_blocks(data, pos):
+    while True:
+        length = data[pos]
+        pos += 1
+        if length == 0:
+            return pos
+        pos += length
+
+
+def _gif_info(path):
+    """Return (frames, (width, height)) of a GIF by walking its blocks.
+
+    Only block headers are read; no frame is decoded.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = (data[6] | data[7] << 8, data[8] | data[9] << 8)
+        pos = 13
+        if data[10] & 0x80:
+            pos += 3 * (2 ** ((data[10] & 0x07) + 1))
+        frames = 0
+        while pos < len(data):
+            block = data[pos]
+            if block == 0x21:  # extension
+                pos = _skip_sub_blocks(data, pos + 2)
+            elif block == 0x2C:  # image descriptor
+                frames += 1
+                flags = data[pos + 9]
+                pos += 10
+                if flags & 0x80:
+                    pos += 3 * (2 ** ((flags & 0x07) + 1))
+                pos = _skip_sub_blocks(data, pos + 1)  # skip LZW code size + data
+            else:  # trailer (0x3B) or garbage
+                break
+    return frames, size
+
+
+def plan_reduction(ratio, width, min_width=MIN_WIDTH):
+    """Return (scale, keep) that shrink output to `ratio` of its size.
+
+    Output size is modelled as proportional to pixels per frame times the
+    number of frames. Resolution is reduced first, down to `min_width`;
+    after that frames are dropped, keeping a fraction `keep` of them.
+    """
+    ratio = min(1.0, ratio)
+    min_scale = min(1.0, min_width / max(width, 1))
+    if ratio >= min_scale ** 2:
+        return math.sqrt(ratio), 1.0
+    return min_scale, ratio / min_scale ** 2
+
+
+def prepare_gif_attachment(path, gif_ms=150, budget=None):
+    """Return a GIF path that fits the attachment budget.
+
+    Returns `path` itself if it already fits, otherwise renders a smaller
+    copy next to it. Palette size is halved once frames have to be dropped.
+    The copy's size is checked and it is rendered again, smaller, if the
+    estimate was off; raises ValueError if it still doesn't fit.
+    """
+    budget = budget or attachment_budget()
+    size_bytes = os.path.getsize(path)
+    if size_bytes <= budget:
+        return path
+
+    frames, (width, height) = _gif_info(path)
+    output_path = _attachment_path(path)
+
+    def render(target):
+        scale, keep = plan_reduction(target * SAFETY / size_bytes, width)
+        colors = 256
+        if keep < 1.0:
+            # 7 instead of 8 bits per pixel buys back some frames
+            colors = 128
+            keep = min(1.0, keep * 8 / 7)
+
+        out_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        image_files = list_photo_files(size=out_size)
+        target_frames = max(1, int(frames * keep))
+        stride = max(1, math.ceil(len(image_files) / target_frames))
+
+        print(f"GIF is {size_bytes / 1e6:.1f} MB; rendering {out_size[0]}x{out_size[1]}, "
+              f"every {stride} photos, {colors} colours for Discord")
+        write_gif(image_files, output_path, gif_ms=gif_ms, size=out_size, stride=stride, colors=colors)
+
+    return _fit(render, path, output_path, budget)
+
+
+def _video_info(path):
+    """Return (frames, fps, (width, height)) of a video."""
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+    return max(frames, 1), fps, size
+
+
+def _transcode_webm(path, output_path, fps, frames, size, budget):
+    """Re-encode with ffmpeg at the bitrate that just fits `budget`."""
+    width, height = size
+    duration = frames / fps
+    bitrate = budget * SAFETY * 8 / duration
+
+    # Scale down until each pixel gets a sensible number of bits, then
+    # drop frames if even MIN_WIDTH is too large for the bitrate.
+    bpp = bitrate / (fps * width * height)
+    scale, keep = plan_reduction(bpp / MIN_VIDEO_BPP, width)
+    step = math.ceil(1 / keep)
+
+    filters = []
+    if step > 1:
+        filters.append(f"select='not(mod(n\\,{step}))',setpts=N/FRAME_RATE/TB")
+        bitrate *= step  # same number of bytes spread over fewer frames
+    if scale < 1.0:
+        filters.append(f"scale={int(width * scale) // 2 * 2}:-2")
+
+    command = [shutil.which("ffmpeg"), "-y", "-loglevel", "error", "-i", path]
+    if filters:
+        command += ["-vf", ",".join(filters), "-r", str(fps)]
+    # Constant bitrate with a small buffer so a single pass lands inside
+    # the budget; VBR overshoots badly on short, noisy clips.
+    rate = str(int(bitrate))
+    command += ["-c:v", "libvpx-vp9", "-b:v", rate, "-minrate", rate, "-maxrate", rate,
+                "-bufsize", str(int(bitrate / 2)), "-deadline", "realtime", "-cpu-used", "8",
+                "-an", output_path]
+    print(f"WebM is {os.path.getsize(path) / 1e6:.1f} MB; transcoding at {bitrate / 1000:.0f} kbit/s, "
+          f"scale {scale:.2f}, every {step} frames for Discord")
+    subprocess.run(command, check=True)
+
+
+def prepare_webm_attachment(path, fps=30, budget=None, workers=None):
+    """Return a WebM path that fits the attachment budget.
+
+    Returns `path` itself if it already fits. Otherwise transcodes at a
+    computed bitrate with ffmpeg, or without ffmpeg re-renders from the
+    photos at a resolution and frame stride chosen from the size model.
+    Like GIFs, the copy is rendered again if it comes out too large.
+    """
+    budget = budget or attachment_budget()
+    size_bytes = os.path.getsize(path)
+    if size_bytes <= budget:
+        return path
+
+    frames, source_fps, (width, height) = _video_info(path)
+    output_path = _attachment_path(path)
+    if shutil.which("ffmpeg"):
+        def render(target):
+            _transcode_webm(path, output_path, source_fps, frames, (width, height), target)
+    else:
+        def render(target):
+            scale, keep = plan_reduction(target * SAFETY / size_bytes, width)
+            out_size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+            image_files = list_photo_files(size=out_size)
+            stride = max(1, math.ceil(len(image_files) / max(1, int(frames * keep))))
+            print(f"WebM is {size_bytes / 1e6:.1f} MB; rendering {out_size[0]}x{out_size[1]}, "
+                  f"every {stride} photos for Discord")
+            write_webm(image_files[::stride], output_path, fps=fps, size=out_size, workers=workers)
+
+    return _fit(render, path, output_path, budget)
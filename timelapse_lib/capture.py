@@ -1,26 +1,24 @@
 import os
 import datetime
-import glob
 import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-from .config import PHOTOS_DIR
+import numpy as np
+from .config import camera_series, get_capture_devices, get_settings
+from .database import get_latest_photo_row, store_photo
+from .metrics import span
+from .proxies import write_proxies
+from .storage import shard_dir
 
 
 def ensure_photos_dir():
-    os.makedirs(PHOTOS_DIR, exist_ok=True)
+    os.makedirs(get_settings().photos_dir, exist_ok=True)
 
 
-def capture_photo(device=0, warmup_seconds=10):
-    """Capture a single image from the webcam and save it under `photos/`.
-
-    The function will warm up the camera for `warmup_seconds` seconds by
-    continuously reading frames (and sleeping briefly). This helps avoid
-    grey/underexposed frames immediately after a device restart.
-
-    Returns the absolute path to the saved image.
-    """
-    ensure_photos_dir()
-
+def open_camera(device=0):
+    """Open the webcam, preferring the V4L2 backend on Linux."""
     # prefer v4l2 backend on linux if available
     cap = None
     try:
@@ -34,38 +32,277 @@ def capture_photo(device=0, warmup_seconds=10):
 
     if not cap.isOpened():
         raise RuntimeError("Could not open webcam")
+    return cap
+
+
+WarmupResult = namedtuple("WarmupResult", ["frame", "seconds", "frames", "reason"])
+
+
+def frame_stats(frame, width=160):
+    """Return (mean luminance, sharpness) of a downscaled grayscale `frame`.
+
+    Sharpness is the variance of the Laplacian. Both are computed with NumPy
+    on a `width`-pixel-wide thumbnail so they cost well under a millisecond.
+    """
+    height, src_width = frame.shape[:2]
+    if src_width > width:
+        size = (width, max(1, round(height * width / src_width)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    gray = frame.astype(np.float32)
+    if gray.ndim == 3:
+        gray = gray @ np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR
+    laplacian = (4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1]
+                 - gray[1:-1, :-2] - gray[1:-1, 2:])
+    return float(gray.mean()), float(laplacian.var())
+
+
+def warm_up(cap, warmup_seconds=10, luma_tolerance=1.0, sharpness_tolerance=0.1,
+            stable_frames=3, min_frames=6, min_luma=4.0):
+    """Read frames until the camera's exposure has settled.
 
-    # Warm up: read frames for the requested duration so the camera can
-    # auto-expose and stabilise. We read continuously and keep the last
-    # successful frame.
+    Tracks mean luminance and sharpness of each frame and stops once
+    `stable_frames` consecutive frames change by less than `luma_tolerance`
+    (0-255 levels) and `sharpness_tolerance` (relative). The first
+    `min_frames` frames never count, since drivers hand out a few stale
+    buffered frames after opening, nor do near-black frames.
+    `warmup_seconds` is a hard timeout.
+
+    Returns a WarmupResult whose `frame` is the last good frame (or None)
+    and `reason` is "stable", "timeout" or "no frames".
+    """
     last_frame = None
-    ret = False
-    end_time = time.time() + max(0, warmup_seconds)
-    while time.time() < end_time:
+    previous = None
+    frames = 0
+    stable = 0
+    reason = "timeout"
+    started = time.monotonic()
+    end_time = started + max(0, warmup_seconds)
+    while time.monotonic() < end_time:
         ret, frame = cap.read()
-        if ret:
-            last_frame = frame
-        # sleep a short while to avoid busy-looping; reading may already block
-        time.sleep(0.1)
+        if not ret:
+            # sleep a short while to avoid busy-looping on a failing device
+            time.sleep(0.1)
+            continue
+        last_frame = frame
+        frames += 1
+
+        luma, sharpness = frame_stats(frame)
+        if previous is not None and frames > min_frames and luma >= min_luma:
+            luma_delta = abs(luma - previous[0])
+            sharpness_delta = abs(sharpness - previous[1]) / max(previous[1], 1e-6)
+            if luma_delta <= luma_tolerance and sharpness_delta <= sharpness_tolerance:
+                stable += 1
+            else:
+                stable = 0
+        previous = (luma, sharpness)
+
+        if stable >= stable_frames:
+            reason = "stable"
+            break
+
+    if last_frame is None:
+        reason = "no frames"
+    return WarmupResult(last_frame, time.monotonic() - started, frames, reason)
+
+
+def save_frame(frame, camera=0):
+    """Write `frame` to a timestamped JPEG under `photos/YYYY/MM/DD/` and return its path.
+
+    Frames from cameras other than 0 go to their own series under
+    `photos/cam<N>/YYYY/MM/DD/`.
+
+    The photo is indexed in the database and its proxies are written from
+    the frame still in memory, so nothing has to decode the JPEG again.
+    A database or proxy failure is reported but doesn't lose the photo.
+    """
+    now = datetime.datetime.now()
+    directory = shard_dir(now, camera=camera)
+    os.makedirs(directory, exist_ok=True)
+    filename = f"photo_{now.strftime('%Y-%m-%d_%H-%M-%S')}.jpg"
+    full_path = os.path.abspath(os.path.join(directory, filename))
+    with span("capture.imwrite"):
+        if not cv2.imwrite(full_path, frame):
+            raise RuntimeError(f"Could not write {full_path}")
+
+    try:
+        height, width = frame.shape[:2]
+        with span("capture.index"):
+            photo_id = store_photo(full_path, width=width, height=height, camera=camera)
+        with span("capture.proxies"):
+            write_proxies(photo_id, frame)
+    except Exception as e:
+        print(f"⚠️ Could not index photo or write proxies: {e}")
+    return full_path
+
+
+def capture_photo(device=None, warmup_seconds=None, tolerance=None):
+    """Capture a single image from the webcam and save it under `photos/`.
+
+    The camera is warmed up by reading frames until luminance and sharpness
+    stop changing (within `tolerance` grey levels), for at most
+    `warmup_seconds` seconds. This helps avoid grey/underexposed frames
+    immediately after a device restart without always paying the full
+    timeout. Settle time and stop reason are logged.
+    Unset arguments come from the settings (see config.get_settings).
+
+    Returns the absolute path to the saved image.
+    """
+    settings = get_settings()
+    device = settings.camera_device if device is None else device
+    warmup_seconds = settings.warmup_seconds if warmup_seconds is None else warmup_seconds
+    tolerance = settings.warmup_tolerance if tolerance is None else tolerance
+    ensure_photos_dir()
 
-    cap.release()
+    with span("capture.open"):
+        cap = open_camera(device)
+    try:
+        with span("capture.warmup"):
+            warmup = warm_up(cap, warmup_seconds, luma_tolerance=tolerance)
+    finally:
+        cap.release()
 
-    if not ret or last_frame is None:
+    if warmup.frame is None:
         raise RuntimeError("Could not read frame from webcam")
+    print(f"📷 Camera {device} settled in {warmup.seconds:.2f}s after {warmup.frames} frames ({warmup.reason})")
+
+    return save_frame(warmup.frame, camera=camera_series(device))
+
+
+def capture_photos(devices=None, warmup_seconds=None, tolerance=None):
+    """Capture one photo from each camera in `devices`, all at the same time.
+
+    Each device is opened, warmed up and read on its own thread, so N
+    cameras take about as long as one warmup. `devices` defaults to
+    CAMERA_DEVICES, else the single CAMERA_DEVICE. Returns {device: path}
+    for the cameras that succeeded; raises if none did.
+    """
+    devices = devices or get_capture_devices()
+    if len(devices) == 1:
+        return {devices[0]: capture_photo(devices[0], warmup_seconds, tolerance)}
+
+    with ThreadPoolExecutor(max_workers=len(devices), thread_name_prefix="camera") as pool:
+        futures = {device: pool.submit(capture_photo, device, warmup_seconds, tolerance) for device in devices}
+    paths = {}
+    for device, future in futures.items():
+        try:
+            paths[device] = future.result()
+        except Exception as e:
+            print(f"⚠️ Camera {device} failed: {e}")
+    if not paths:
+        raise RuntimeError(f"Could not capture from any of cameras {', '.join(map(str, devices))}")
+    return paths
+
+
+def run_capture_daemon(interval=None, device=None, warmup_seconds=None, tolerance=None, on_capture=None,
+                       grab_interval=0.2, max_backoff=60):
+    """Capture a photo every `interval` seconds from a camera that stays open.
+
+    Between shots the daemon keeps grabbing (but not decoding) frames, so
+    auto-exposure stays converged and the driver always holds a fresh frame;
+    a scheduled capture then only costs one read. If the camera disconnects
+    it is reopened with exponential backoff and warmed up again.
+
+    `on_capture(path)` is called after each saved photo. Runs until
+    interrupted. Unset arguments come from the settings; an unset
+    `interval` is re-read after every shot, so editing CAPTURE_INTERVAL in
+    `.env` takes effect without a restart.
+    """
+    settings = get_settings()
+    device = settings.camera_device if device is None else device
+    warmup_seconds = settings.warmup_seconds if warmup_seconds is None else warmup_seconds
+    tolerance = settings.warmup_tolerance if tolerance is None else tolerance
+    cap = None
+    backoff = 1
+    next_shot = time.monotonic()
+    try:
+        while True:
+            if cap is None:
+                try:
+                    cap = open_camera(device)
+                    warmup = warm_up(cap, warmup_seconds, luma_tolerance=tolerance)
+                    if warmup.frame is None:
+                        raise RuntimeError("Could not read frame from webcam")
+                    backoff = 1
+                    print(f"📷 Camera {device} ready, settled in {warmup.seconds:.2f}s ({warmup.reason})")
+                except Exception as e:
+                    if cap is not None:
+                        cap.release()
+                        cap = None
+                    print(f"⚠️ Camera unavailable ({e}); retrying in {backoff}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, max_backoff)
+                    continue
+
+            now = time.monotonic()
+            if now < next_shot:
+                if not cap.grab():
+                    print("⚠️ Lost camera, reopening")
+                    cap.release()
+                    cap = None
+                    continue
+                time.sleep(min(grab_interval, next_shot - now))
+                continue
+
+            ret, frame = cap.read()
+            if not ret:
+                # Keep next_shot as is so we capture as soon as it's back
+                print("⚠️ Lost camera, reopening")
+                cap.release()
+                cap = None
+                continue
+
+            path = save_frame(frame, camera=camera_series(device))
+            print(f"📸 Captured {path}")
+            step = get_settings().capture_interval if interval is None else interval
+            next_shot += step
+            if next_shot <= time.monotonic():
+                # We fell behind (e.g. after a reconnect); don't burst-capture
+                next_shot = time.monotonic() + step
+
+            if on_capture:
+                try:
+                    on_capture(path)
+                except Exception:
+                    traceback.print_exc()
+    finally:
+        if cap is not None:
+            cap.release()
+
+
+class CameraSession:
+    """A camera that stays open between captures, e.g. scheduler jobs.
+
+    The first capture warms the camera up from cold; later ones only read
+    until exposure is stable again, which on an open camera takes a few
+    frames. A failed read closes the camera so the next capture reopens it.
+    """
+
+    def __init__(self, device=None):
+        self.device = device
+        self.cap = None
 
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"photo_{timestamp}.jpg"
-    full_path = os.path.join(PHOTOS_DIR, filename)
-    cv2.imwrite(full_path, last_frame)
-    return os.path.abspath(full_path)
+    def capture(self, warmup_seconds=None):
+        """Capture and save one photo. Returns the absolute path."""
+        settings = get_settings()
+        device = settings.camera_device if self.device is None else self.device
+        warmup_seconds = settings.warmup_seconds if warmup_seconds is None else warmup_seconds
+        if self.cap is None:
+            with span("capture.open"):
+                self.cap = open_camera(device)
+        with span("capture.warmup"):
+            warmup = warm_up(self.cap, warmup_seconds, luma_tolerance=settings.warmup_tolerance)
+        if warmup.frame is None:
+            self.close()
+            raise RuntimeError("Could not read frame from webcam")
+        return save_frame(warmup.frame, camera=camera_series(device))
 
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
 
-def get_latest_photo():
-    patterns = [os.path.join(PHOTOS_DIR, "*.jpg"), os.path.join(PHOTOS_DIR, "*.png")]
-    files = []
-    for p in patterns:
-        files.extend(glob.glob(p))
 
-    if not files:
-        return None
-    return max(files, key=os.path.getmtime)
+def get_latest_photo(camera=None):
+    """Return the path of the most recently captured photo (from `camera`, if given), or None."""
+    row = get_latest_photo_row(camera=camera)
+    return row["photo_path"] if row else None
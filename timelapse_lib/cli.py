@@ -1,82 +1,313 @@
-from .capture import capture_photo
-from .discord_webhook import send_discord_message_in_photo_channel, send_discord_message_in_ai_channel
+# Subcommands import what they need when they run: cron fires a capture
+# every few minutes, and it shouldn't pay for loading the Gemini SDK,
+# requests or PIL. Check with benchmarks/startup.py.
+from .config import get_capture_devices, get_settings, override_settings
 from .disk_stats import get_free_space_gb_str
-from .create_animation import create_gif
-from .create_animation import create_webm
-from .database import store_photo
+from .metrics import flush as flush_metrics, span, start_run
 import datetime
 import traceback
 import argparse
 
 
+def parse_size(value):
+    """argparse type for WIDTHxHEIGHT values such as 1280x720."""
+    try:
+        width, height = (int(v) for v in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    return width, height
+
+
+def parse_devices(value):
+    """argparse type for comma-separated device indexes such as 0,2."""
+    try:
+        devices = tuple(int(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected device indexes like 0,2, got {value!r}")
+    return devices
+
+
 def init_argparse():
     parser = argparse.ArgumentParser(description='Capture timelapse photos')
     parser.add_argument('-a', '--ai', action='store_true', help='Send ai summary of photo to Discord AI channel')
+    parser.add_argument('--ai-batch', action='store_true', help='Analyse every photo that has no AI analysis yet')
+    parser.add_argument('--concurrency', type=int, metavar='N', help='Parallel AI requests for --ai-batch (default: AI_CONCURRENCY or 4)')
+    parser.add_argument('--rate', type=int, metavar='N', help='Maximum AI requests per minute for --ai-batch (default: AI_RATE or 60)')
     parser.add_argument('-d', '--discord', action='store_true', help='Send Discord notifications')
     parser.add_argument('-g', '--gif', action='store_true', help='Create animated GIF from captured photos')
-    parser.add_argument('-m', '--gif-ms', type=int, default=150, metavar='MS', help='Frame duration in milliseconds for GIF (default: 100)')
+    parser.add_argument('-m', '--gif-ms', type=int, metavar='MS', help='Frame duration in milliseconds for GIF (default: GIF_MS or 150)')
+    parser.add_argument('-s', '--size', type=parse_size, metavar='WxH', help='Maximum output resolution for GIF, e.g. 1280x720 (default: GIF_SIZE)')
+    parser.add_argument('--stride', type=int, metavar='N', help='Only use every Nth photo for GIF (default: GIF_STRIDE or 1)')
+    parser.add_argument('--no-filter', action='store_true', help='Render every photo, including dark, blurry and duplicate frames')
+    parser.add_argument('--reconcile', action='store_true', help='Sync the photo index in the database with the files in photos/')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Recompute the daily/weekly plant score rollups from all analyses')
+    parser.add_argument('--backfill-proxies', action='store_true', help='Create downscaled proxies for photos that have none')
+    parser.add_argument('--stats', nargs='?', const=7.0, type=float, metavar='DAYS', help='Print p50/p95 time per stage over the last DAYS days (default: 7)')
+    parser.add_argument('--retention', action='store_true', help='Archive old photos and free disk space until the retention policy is met')
+    parser.add_argument('--migrate-layout', action='store_true', help='Move photos from the flat photos/ directory into photos/YYYY/MM/DD/')
+    parser.add_argument('--ingest', metavar='DIR', help='Index all photos under DIR (e.g. an archive copied from another machine)')
+    parser.add_argument('--ingest-hash', action='store_true', help='Also compute content hashes during --ingest (reads every file)')
+    parser.add_argument('--daemon', action='store_true', help='Keep the camera open and capture every --interval seconds')
+    parser.add_argument('--schedule', action='store_true', help='Run capture, AI batch, renders, retention and the weekly report from one long-running scheduler')
+    parser.add_argument('--interval', type=int, metavar='SECONDS', help='Seconds between captures in --daemon mode (default: CAPTURE_INTERVAL or 300)')
     parser.add_argument('-w', '--webm', action='store_true', help='Create animated WebM from captured photos')
-    parser.add_argument('-f', '--webm-fps', type=int, default=6, metavar='MS', help='FPS for webm (default: 6)')
+    parser.add_argument('-f', '--webm-fps', type=int, metavar='FPS', help='FPS for webm (default: WEBM_FPS or 6)')
+    parser.add_argument('-i', '--incremental', action='store_true', help='Only encode photos added since the last GIF/webm render')
+    parser.add_argument('--rebuild', action='store_true', help='Discard incremental render segments and start over')
+    parser.add_argument('--workers', type=int, metavar='N', help='Decode threads for webm (default: DECODE_WORKERS or CPU count)')
+    parser.add_argument('--processes', type=int, metavar='N', help='Encode webm as N segments in parallel processes and join them (default: ENCODE_PROCESSES or 1)')
+    parser.add_argument('--device', type=int, metavar='N', help='Camera device index (default: CAMERA_DEVICE or 0)')
+    parser.add_argument('--devices', type=parse_devices, metavar='N,N', help='Capture from several cameras at once, e.g. 0,2 (default: CAMERA_DEVICES)')
+    parser.add_argument('--camera', type=int, metavar='N', help='Camera whose series renders and --ai use (default: CAMERA or 0)')
+    parser.add_argument('--warmup', type=float, metavar='SECONDS', help='Maximum camera warmup time (default: WARMUP_SECONDS or 10)')
     return parser
 
 
 def main(argv):
     parser = init_argparse()
     args = parser.parse_args(argv)
+    # Flags override environment/.env values; unset flags are None and ignored
+    override_settings(
+        ai_concurrency=args.concurrency,
+        ai_rate=args.rate,
+        gif_ms=args.gif_ms,
+        gif_size=args.size,
+        gif_stride=args.stride,
+        capture_interval=args.interval,
+        webm_fps=args.webm_fps,
+        decode_workers=args.workers,
+        encode_processes=args.processes,
+        camera_device=args.device,
+        # An explicit --device means just that camera
+        camera_devices=args.devices or ((args.device,) if args.device is not None else None),
+        camera=args.camera,
+        warmup_seconds=args.warmup,
+        frame_filter=False if args.no_filter else None,
+    )
+    command = next((name for name in COMMANDS if getattr(args, name)), "capture")
+    start_run(command)
+    with span(f"run.{command}"):
+        _dispatch(args)
+
+# Flags that select a subcommand, in _dispatch order (used to label timings)
+COMMANDS = ("gif", "webm", "ai", "ai_batch", "daemon", "schedule", "reconcile", "rebuild_rollups", "backfill_proxies",
+            "retention", "migrate_layout", "stats", "ingest")
+
+def _dispatch(args):
     if args.gif:
         call_create_gif(args)
     elif args.webm:
         call_create_webm(args)
     elif args.ai:
         call_ai_summary(args)
+    elif args.ai_batch:
+        call_ai_batch(args)
+    elif args.daemon:
+        call_capture_daemon(args)
+    elif args.schedule:
+        call_scheduler(args)
+    elif args.reconcile:
+        call_reconcile(args)
+    elif args.rebuild_rollups:
+        call_rebuild_rollups(args)
+    elif args.backfill_proxies:
+        call_backfill_proxies(args)
+    elif args.retention:
+        call_retention(args)
+    elif args.migrate_layout:
+        call_migrate_layout(args)
+    elif args.stats is not None:
+        call_stats(args)
+    elif args.ingest:
+        call_ingest(args)
     else:
         call_take_photo(args)
 
+def _notify(message, file_path=None):
+    from .discord_webhook import send_discord_message_in_photo_channel
+    send_discord_message_in_photo_channel(message, file_path=file_path)
+
 def call_take_photo(args):
+    from .capture import capture_photos
+
     if args.discord:
-        send_discord_message_in_photo_channel("📸 Taking photo...")
+        _notify("📸 Taking photo...")
 
     try:
         disk_space = get_free_space_gb_str("/")
         if not args.gif:
-            filename = capture_photo()
-            # store captured photo in the database (id or None)
-            try:
-                photo_id = store_photo(filename)
-            except Exception:
-                photo_id = None
-            if args.discord:
-                send_discord_message_in_photo_channel(f"✅ Captured photo on {datetime.datetime.now().strftime('%m/%d')} - {disk_space}", file_path=filename)
+            for filename in capture_photos().values():
+                _after_capture(args, filename, disk_space)
     except Exception as e:
         error_msg = f"❌ Error during capture:\n```\n{traceback.format_exc()}\n```"
         if args.discord:
-            send_discord_message_in_photo_channel(error_msg)
+            _notify(error_msg)
         print(error_msg)
 
+def _announce_capture(filename, disk_space=None):
+    if disk_space is None:
+        disk_space = get_free_space_gb_str("/")
+    _notify(f"✅ Captured photo on {datetime.datetime.now().strftime('%m/%d')} - {disk_space}", file_path=filename)
+
+def _after_capture(args, filename, disk_space=None):
+    """Announce a freshly captured photo on Discord (capture already indexed it),
+    then run one small batch of retention work."""
+    if args.discord:
+        _announce_capture(filename, disk_space)
+
+    from .retention import run_retention
+    try:
+        with span("retention"):
+            archived, deleted = run_retention()
+        if archived or deleted:
+            print(f"🗄️ Retention: archived {archived}, deleted {deleted} photos")
+    except Exception as e:
+        print(f"⚠️ Retention failed: {e}")
+    # The daemon never exits, so write this shot's timings now
+    flush_metrics()
+
+def call_capture_daemon(args):
+    import threading
+    from .capture import run_capture_daemon
+
+    settings = get_settings()
+    devices = get_capture_devices()
+    if args.discord:
+        _notify(f"📸 Capture daemon started, one photo every {settings.capture_interval}s")
+    on_capture = lambda filename: _after_capture(args, filename)
+    try:
+        if len(devices) == 1:
+            run_capture_daemon(device=devices[0], on_capture=on_capture)
+            return
+        # One daemon per camera, each keeping its own camera open
+        threads = [threading.Thread(target=run_capture_daemon, kwargs={"device": device, "on_capture": on_capture},
+                                    name=f"camera-{device}", daemon=True) for device in devices]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
+    except KeyboardInterrupt:
+        print("Capture daemon stopped")
+
+def call_scheduler(args):
+    from .scheduler import default_jobs, run_scheduler
+
+    if args.discord:
+        _notify("🕐 Scheduler started")
+    try:
+        run_scheduler(default_jobs(on_capture=_announce_capture if args.discord else None))
+    except KeyboardInterrupt:
+        print("Scheduler stopped")
+
+def call_reconcile(args):
+    from .database import reconcile_photos
+
+    added, removed = reconcile_photos(get_settings().photos_dir)
+    print(f"✅ Photo index reconciled: {added} added, {removed} removed")
+
+def call_rebuild_rollups(args):
+    from .database import rebuild_rollups
+
+    days = rebuild_rollups()
+    print(f"✅ Rebuilt plant score rollups for {days} days")
+
+def call_backfill_proxies(args):
+    from .proxies import backfill_proxies
+
+    created, failed = backfill_proxies(workers=get_settings().decode_workers)
+    print(f"✅ Created proxies for {created} photos ({failed} unreadable)")
+
+def call_retention(args):
+    from .retention import free_space_gb, run_retention
+
+    total_archived = total_deleted = 0
+    while True:
+        archived, deleted = run_retention()
+        if not archived and not deleted:
+            break
+        total_archived += archived
+        total_deleted += deleted
+    print(f"✅ Archived {total_archived} and deleted {total_deleted} photos ({free_space_gb():.2f} GB free)")
+
+def call_stats(args):
+    from .metrics import stage_stats
+
+    stats = stage_stats(days=args.stats)
+    if not stats:
+        print(f"No timings recorded in the last {args.stats:g} days")
+        return
+    print(f"Stage timings over the last {args.stats:g} days")
+    print(f"{'stage':<24} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'failed':>7}")
+    for stage, count, p50, p95, failed in stats:
+        print(f"{stage:<24} {count:>7} {p50:>10.1f} {p95:>10.1f} {failed:>7}")
+
+def call_migrate_layout(args):
+    from .storage import migrate_to_sharded
+
+    moved, skipped = migrate_to_sharded()
+    print(f"✅ Moved {moved} photos into photos/YYYY/MM/DD ({skipped} skipped)")
+
+def call_ingest(args):
+    from .ingest import ingest_photos
+
+    inserted, skipped = ingest_photos(args.ingest, with_hash=args.ingest_hash)
+    print(f"✅ Ingested {inserted} photos from {args.ingest} ({skipped} already indexed)")
+
 def call_create_webm(args):
+    from .attachments import prepare_webm_attachment
+    from .create_animation import create_webm
+    from .incremental import render_webm_incremental
+
     try:
-        output_webm = create_webm(args.webm_fps)
+        with span("render.webm"):
+            if args.incremental:
+                output_webm = render_webm_incremental(rebuild=args.rebuild)
+            else:
+                output_webm = create_webm()
         if args.discord:
-            send_discord_message_in_photo_channel("✅ Created timelapse webm", file_path=output_webm)
+            settings = get_settings()
+            with span("render.attachment"):
+                attachment = prepare_webm_attachment(output_webm, fps=settings.webm_fps, workers=settings.decode_workers)
+            _notify("✅ Created timelapse webm", file_path=attachment)
     except Exception as e:
         error_msg = f"❌ Error during capture:\n```\n{traceback.format_exc()}\n```"
         if args.discord:
-            send_discord_message_in_photo_channel(error_msg)
+            _notify(error_msg)
         print(error_msg)
 
 def call_create_gif(args):
+    from .attachments import prepare_gif_attachment
+    from .create_animation import create_gif
+    from .incremental import render_gif_incremental
+
     try:
-        # output_gif = create_gif(gif_ms=args.gif_ms)
-        output_gif = create_gif()
+        with span("render.gif"):
+            if args.incremental:
+                output_gif = render_gif_incremental(rebuild=args.rebuild)
+            else:
+                output_gif = create_gif()
         if args.discord:
-            send_discord_message_in_photo_channel("✅ Created timelapse GIF", file_path=output_gif)
+            with span("render.attachment"):
+                attachment = prepare_gif_attachment(output_gif, gif_ms=get_settings().gif_ms)
+            _notify("✅ Created timelapse GIF", file_path=attachment)
     except Exception as e:
         error_msg = f"❌ Error during capture:\n```\n{traceback.format_exc()}\n```"
         if args.discord:
-            send_discord_message_in_photo_channel(error_msg)
+            _notify(error_msg)
         print(error_msg)
 
+def call_ai_batch(args):
+    from .gemini import analyse_pending
+
+    succeeded, failed = analyse_pending()
+    print(f"✅ Analysed {succeeded} photos ({failed} failed)")
+    if args.discord and succeeded:
+        _notify(f"🤖 Analysed {succeeded} photos ({failed} failed)")
+
 def call_ai_summary(args):
+    from .discord_webhook import send_discord_message_in_ai_channel
+
     send_discord_message_in_ai_channel("Sending to AI")
 
 if __name__ == "__main__":
@@ -1,9 +1,165 @@
 import os
-import json
+import threading
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Optional, Tuple
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PHOTOS_DIR = os.path.join(BASE_DIR, "photos")
 GIFS_DIR = os.path.join(BASE_DIR, "gifs")
+VIDEOS_DIR = os.path.join(BASE_DIR, "videos")
+PROXIES_DIR = os.path.join(BASE_DIR, "proxies")
+SPOOL_DIR = os.path.join(BASE_DIR, "spool")
+DB_PATH = os.path.join(BASE_DIR, "timelapse.db")
+DOTENV_PATH = os.path.join(BASE_DIR, ".env")
+
+# How often get_settings() checks whether .env has changed
+RELOAD_CHECK_SECONDS = 1.0
+
+
+def _size(value):
+    """Parse WIDTHxHEIGHT, e.g. 1280x720."""
+    width, height = (int(v) for v in value.lower().split("x"))
+    return width, height
+
+
+def _bool(value):
+    """Parse 1/0, true/false, yes/no, on/off."""
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(value)
+
+
+def _int_list(value):
+    """Parse a comma-separated list of integers, e.g. 0,2."""
+    return tuple(int(v) for v in value.split(",") if v.strip())
+
+
+def _path(value):
+    """Expand a path; relative paths are relative to the project root so
+    cron (or other CWDs) still find the right place."""
+    value = os.path.expanduser(value)
+    if not os.path.isabs(value):
+        value = os.path.join(BASE_DIR, value)
+    return os.path.abspath(value)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """All tunables in one place.
+
+    Each field can be set with the environment variable named in
+    ENV_VARS, either in the environment or in `.env`.
+    """
+    # Storage
+    photos_dir: str = PHOTOS_DIR
+    gifs_dir: str = GIFS_DIR
+    videos_dir: str = VIDEOS_DIR
+    proxies_dir: str = PROXIES_DIR
+    spool_dir: str = SPOOL_DIR
+    db_path: str = DB_PATH
+    # Capture
+    camera_device: int = 0
+    camera_devices: Optional[Tuple[int, ...]] = None
+    camera: Optional[int] = None
+    warmup_seconds: float = 10.0
+    warmup_tolerance: float = 1.0
+    capture_interval: int = 300
+    # Retention (see retention.py)
+    retention_min_free_gb: float = 1.0
+    retention_archive_days: int = 30
+    retention_keep_days: int = 7
+    retention_batch: int = 20
+    archive_quality: int = 80
+    # Rendering
+    gif_ms: int = 150
+    gif_size: Optional[Tuple[int, int]] = None
+    gif_stride: int = 1
+    webm_fps: int = 6
+    decode_workers: Optional[int] = None
+    encode_processes: int = 1
+    # Frame filtering (see frame_filter.py)
+    frame_filter: bool = True
+    filter_min_luma: float = 12.0
+    filter_max_luma: float = 245.0
+    filter_blur_ratio: float = 0.2
+    filter_duplicate_bits: int = 0
+    # AI
+    gemini_api_key: Optional[str] = None
+    gemini_base_url: Optional[str] = None
+    gemini_model: str = "gemini-2.5-flash"
+    upload_max_side: int = 1024
+    upload_quality: int = 85
+    ai_concurrency: int = 4
+    ai_rate: int = 60
+    ai_batch_limit: int = 100  # per scheduled batch; 0 for no limit
+    # Discord
+    photo_webhook_url: Optional[str] = None
+    ai_webhook_url: Optional[str] = None
+    discord_max_attachment_mb: float = 10.0
+    # Scheduler (see scheduler.py); 0 or empty disables a job
+    ai_batch_interval: int = 3600
+    render_interval: int = 3600
+    weekly_report_at: str = "sat 12:00"
+    # Stage timings (see metrics.py)
+    metrics: bool = True
+
+
+# field name -> (environment variable, parser)
+ENV_VARS = {
+    "photos_dir": ("PHOTO_PATH", _path),
+    "gifs_dir": ("GIF_PATH", _path),
+    "videos_dir": ("VIDEO_PATH", _path),
+    "proxies_dir": ("PROXY_PATH", _path),
+    "spool_dir": ("SPOOL_PATH", _path),
+    "db_path": ("DB_PATH", _path),
+    "camera_device": ("CAMERA_DEVICE", int),
+    "camera_devices": ("CAMERA_DEVICES", _int_list),
+    "camera": ("CAMERA", int),
+    "warmup_seconds": ("WARMUP_SECONDS", float),
+    "warmup_tolerance": ("WARMUP_TOLERANCE", float),
+    "capture_interval": ("CAPTURE_INTERVAL", int),
+    "retention_min_free_gb": ("RETENTION_MIN_FREE_GB", float),
+    "retention_archive_days": ("RETENTION_ARCHIVE_DAYS", int),
+    "retention_keep_days": ("RETENTION_KEEP_DAYS", int),
+    "retention_batch": ("RETENTION_BATCH", int),
+    "archive_quality": ("ARCHIVE_QUALITY", int),
+    "gif_ms": ("GIF_MS", int),
+    "gif_size": ("GIF_SIZE", _size),
+    "gif_stride": ("GIF_STRIDE", int),
+    "webm_fps": ("WEBM_FPS", int),
+    "decode_workers": ("DECODE_WORKERS", int),
+    "encode_processes": ("ENCODE_PROCESSES", int),
+    "frame_filter": ("FRAME_FILTER", _bool),
+    "filter_min_luma": ("FILTER_MIN_LUMA", float),
+    "filter_max_luma": ("FILTER_MAX_LUMA", float),
+    "filter_blur_ratio": ("FILTER_BLUR_RATIO", float),
+    "filter_duplicate_bits": ("FILTER_DUPLICATE_BITS", int),
+    "gemini_api_key": ("GEMINI_API_KEY", str),
+    "gemini_base_url": ("GEMINI_BASE_URL", str),
+    "gemini_model": ("GEMINI_MODEL", str),
+    "upload_max_side": ("GEMINI_UPLOAD_MAX_SIDE", int),
+    "upload_quality": ("GEMINI_UPLOAD_QUALITY", int),
+    "ai_concurrency": ("AI_CONCURRENCY", int),
+    "ai_rate": ("AI_RATE", int),
+    "ai_batch_limit": ("AI_BATCH_LIMIT", int),
+    "photo_webhook_url": ("PHOTO_WEBHOOK_URL", str),
+    "ai_webhook_url": ("PHOTO_AI_URL", str),
+    "discord_max_attachment_mb": ("DISCORD_MAX_ATTACHMENT_MB", float),
+    "ai_batch_interval": ("AI_BATCH_INTERVAL", int),
+    "render_interval": ("RENDER_INTERVAL", int),
+    "weekly_report_at": ("WEEKLY_REPORT_AT", str),
+    "metrics": ("METRICS", _bool),
+}
+
+_lock = threading.Lock()
+_cached = None
+_cached_mtime = None
+_checked_at = 0.0
+_overrides = {}
 
 
 def load_secrets():
@@ -14,16 +170,10 @@ def load_secrets():
     """
     data = {}
 
-    # Highest precedence: explicit environment variables
-    env_val = os.environ.get("PHOTO_WEBHOOK_URL")
-    if env_val:
-        data["PHOTO_WEBHOOK_URL"] = env_val
-
-    # Next: parse a .env file in the project root (simple KEY=VALUE parser)
-    dotenv_path = os.path.join(BASE_DIR, ".env")
-    if os.path.exists(dotenv_path):
+    # Parse a .env file in the project root (simple KEY=VALUE parser)
+    if os.path.exists(DOTENV_PATH):
         try:
-            with open(dotenv_path, "r") as f:
+            with open(DOTENV_PATH, "r") as f:
                 for line in f:
                     line = line.strip()
                     if not line or line.startswith("#"):
@@ -33,18 +183,100 @@ def load_secrets():
                     k, v = line.split("=", 1)
                     k = k.strip()
                     v = v.strip().strip('"').strip("'")
-                    # only set if not already provided via environment
-                    if k not in data:
-                        data[k] = v
+                    data[k] = v
         except Exception:
             # ignore parse errors
             pass
 
+    # Highest precedence: explicit environment variables
+    for env_name, _ in ENV_VARS.values():
+        env_val = os.environ.get(env_name)
+        if env_val:
+            data[env_name] = env_val
+
     return data
 
 
+def _build_settings():
+    values = {}
+    secrets = load_secrets()
+    for name, (env_name, parse) in ENV_VARS.items():
+        raw = secrets.get(env_name)
+        if not raw:
+            continue
+        try:
+            values[name] = parse(raw)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid {env_name}={raw!r}")
+    return replace(Settings(**values), **_overrides)
+
+
+def _dotenv_mtime():
+    try:
+        return os.stat(DOTENV_PATH).st_mtime
+    except OSError:
+        return None
+
+
+def get_settings():
+    """Return the current Settings.
+
+    Loaded once and memoized; `.env` is re-read only when its mtime changes
+    (checked at most once a second), so long-running processes pick up edits
+    without touching the file on every call.
+    """
+    global _cached, _cached_mtime, _checked_at
+    now = time.monotonic()
+    if _cached is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _cached
+    with _lock:
+        mtime = _dotenv_mtime()
+        if _cached is None or mtime != _cached_mtime:
+            _cached = _build_settings()
+            _cached_mtime = mtime
+        _checked_at = now
+        return _cached
+
+
+def override_settings(**values):
+    """Apply overrides (e.g. from command-line flags) on top of env/.env.
+
+    `None` values are ignored so unset flags fall through to the defaults.
+    """
+    global _cached
+    known = {f.name for f in fields(Settings)}
+    with _lock:
+        for name, value in values.items():
+            if name not in known:
+                raise TypeError(f"Unknown setting: {name}")
+            if value is not None:
+                _overrides[name] = value
+        _cached = None
+
+
+def get_capture_devices():
+    """Return the camera devices to capture from: CAMERA_DEVICES, else CAMERA_DEVICE."""
+    settings = get_settings()
+    return settings.camera_devices or (settings.camera_device,)
+
+
+def camera_series(device):
+    """Return the series photos from camera `device` are stored under.
+
+    A single camera is always series 0 (`photos/`), whatever its device
+    index; with several, each camera's series is its device index.
+    """
+    return device if len(get_capture_devices()) > 1 else 0
+
+
+def get_camera():
+    """Return the series renders and --ai use: CAMERA, else the first capture device's."""
+    camera = get_settings().camera
+    return camera_series(get_capture_devices()[0]) if camera is None else camera
+
+
 def get_photo_webhook_url():
-    return load_secrets().get("PHOTO_WEBHOOK_URL")
+    return get_settings().photo_webhook_url
 
 def get_ai_webhook_url():
-    return load_secrets().get("PHOTO_AI_URL")
\ No newline at end of file
+    return get_settings().ai_webhook_url
@@ -1,14 +1,22 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from PIL import Image
+from PIL import Image, GifImagePlugin
+import itertools
+import multiprocessing
 import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
 import cv2
-import numpy as np
 
-from timelapse_lib.config import GIFS_DIR
-from timelapse_lib.config import PHOTOS_DIR
-
-# Create videos directory next to GIFS_DIR
-VIDEOS_DIR = os.path.join(os.path.dirname(GIFS_DIR), "videos")
+from timelapse_lib.config import get_camera, get_settings
+from timelapse_lib.database import get_photos_in_range
+from timelapse_lib.frame_filter import select_frames
+from timelapse_lib.proxies import proxy_paths
+from timelapse_lib.storage import camera_suffix
 
 
 def ensure_gifs_dir():
@@ -20,44 +28,56 @@ def ensure_gifs_dir():
         output_path (str): Path where the GIF will be saved
         duration (int): Duration for each frame in milliseconds
     """
-    os.makedirs(GIFS_DIR, exist_ok=True)
+    os.makedirs(get_settings().gifs_dir, exist_ok=True)
 
 def ensure_videos_dir():
     """Create the videos directory if it doesn't exist."""
-    os.makedirs(VIDEOS_DIR, exist_ok=True)
+    os.makedirs(get_settings().videos_dir, exist_ok=True)
+
+def select_photos(start=None, end=None, camera=None):
+    """Return the rows of one camera's photos worth rendering in [start, end), oldest first.
 
-def create_webm(fps=30):
+    Dark, blurry and duplicate frames are left out unless frame filtering
+    is turned off (FRAME_FILTER=0 or --no-filter). `camera` defaults to
+    config.get_camera().
     """
-    Create a WebM video from all images in the specified directory.
-    
-    Args:
-        fps (int): Frames per second for the output video
+    camera = get_camera() if camera is None else camera
+    rows = select_frames(get_photos_in_range(start, end, camera=camera))
+    if not rows:
+        raise ValueError("No photos indexed in the database (try --reconcile)")
+    return rows
+
+
+def list_photo_files(start=None, end=None, size=None, camera=None):
+    """Return the paths of one camera's photos captured in [start, end), oldest first.
+
+    See select_photos() for which photos are included. With a (width,
+    height) `size`, each photo's smallest proxy that still covers it is
+    returned instead of the full-resolution file where one exists.
     """
-    ensure_videos_dir()
+    return proxy_paths(select_photos(start, end, camera=camera), size)
+
+
+def source_size(rows):
+    """Return the (width, height) to render `rows` at: the largest stored size.
+
+    Archived photos are stored at a fraction of their original size, so
+    neither the oldest nor any single frame is a safe choice. Falls back to
+    decoding the newest photo if no row has its dimensions recorded.
+    """
+    sizes = [(row["width"], row["height"]) for row in rows if row.get("width") and row.get("height")]
+    if sizes:
+        return max(sizes, key=lambda size: size[0] * size[1])
+    return _frame_size(rows[-1]["photo_path"])
+
+
+def _open_video_writer(output_path, fps, size):
+    """Open a VideoWriter for `output_path`, trying codecs in order of preference.
+
+    Returns a tuple of (writer, (fourcc, description)).
+    """
+    width, height = size
 
-    # Ensure the photos directory exists
-    if not os.path.exists(PHOTOS_DIR):
-        raise ValueError(f"Photos directory does not exist: {PHOTOS_DIR}")
-    
-    # Get all image files in the directory
-    image_files = []
-    for filename in sorted(os.listdir(PHOTOS_DIR)):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            file_path = os.path.join(PHOTOS_DIR, filename)
-            image_files.append(file_path)
-    
-    if not image_files:
-        raise ValueError(f"No images found in the directory: {PHOTOS_DIR}")
-    
-    # Read first image to get dimensions
-    first_image = cv2.imread(image_files[0])
-    height, width = first_image.shape[:2]
-    
-    # Create output path
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"timelapse_{timestamp}.webm"
-    output_path = os.path.join(VIDEOS_DIR, filename)
-    
     # Try multiple codecs and pick the first that works. OpenCV/ffmpeg builds
     # vary in which codecs are available. We'll attempt common candidates
     # and return the first successful VideoWriter.
@@ -70,16 +90,12 @@ def create_webm(fps=30):
         ('MJPG', "Motion JPEG")
     ]
 
-    out = None
-    used_codec = None
     for code, human in candidates:
         fourcc = cv2.VideoWriter_fourcc(*code)
         writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
         # Test if writer was opened successfully
         if writer.isOpened():
-            out = writer
-            used_codec = (code, human)
-            break
+            return writer, (code, human)
         else:
             # release if partially created
             try:
@@ -87,69 +103,310 @@ def create_webm(fps=30):
             except Exception:
                 pass
 
-    if out is None:
-        # Provide actionable fallback instructions using ffmpeg
-        raise RuntimeError(
-            "Unable to create VideoWriter with available codecs. "
-            "Your OpenCV build may lack WebM/VP8/VP9 support. "
-            "You can create a WebM with ffmpeg as a fallback. Example:\n\n"
-            "ffmpeg -framerate 30 -pattern_type glob -i 'photos/*.jpg' "
-            "-c:v libvpx -b:v 1M output.webm\n\n"
-            "or for VP9 (better quality, slower):\n"
-            "ffmpeg -framerate 30 -pattern_type glob -i 'photos/*.jpg' "
-            "-c:v libvpx-vp9 -b:v 0 -crf 30 output.webm"
-        )
-    
+    # Provide actionable fallback instructions using ffmpeg
+    raise RuntimeError(
+        "Unable to create VideoWriter with available codecs. "
+        "Your OpenCV build may lack WebM/VP8/VP9 support. "
+        "You can create a WebM with ffmpeg as a fallback. Example:\n\n"
+        "ffmpeg -framerate 30 -pattern_type glob -i 'photos/*/*/*/*.jpg' "
+        "-c:v libvpx -b:v 1M output.webm\n\n"
+        "or for VP9 (better quality, slower):\n"
+        "ffmpeg -framerate 30 -pattern_type glob -i 'photos/*/*/*/*.jpg' "
+        "-c:v libvpx-vp9 -b:v 0 -crf 30 output.webm"
+    )
+
+
+def _read_frame(image_path, size):
+    """Decode one image, resizing it to `size` (width, height) if it differs."""
+    frame = cv2.imread(image_path)
+    if frame is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def _prefetch_frames(image_files, size, workers=None, prefetch=None):
+    """Yield decoded frames in order while a thread pool decodes ahead.
+
+    At most `prefetch` frames are decoded or waiting at any time, so memory
+    stays bounded while the writer consumes frames. cv2.imread releases the
+    GIL, so threads are enough to keep several cores busy.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    prefetch = max(1, prefetch or workers * 2)
+    files = iter(image_files)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for image_path in itertools.islice(files, prefetch):
+                pending.append(pool.submit(_read_frame, image_path, size))
+            while pending:
+                frame = pending.popleft().result()
+                next_path = next(files, None)
+                if next_path is not None:
+                    pending.append(pool.submit(_read_frame, next_path, size))
+                yield frame
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _frame_size(image_path):
+    """Return (width, height) of an image."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    height, width = image.shape[:2]
+    return width, height
+
+
+def _encode_video(image_files, output_path, fps, size, workers=None):
+    """Write `image_files` at `size` into a new video. Returns (frames, codec)."""
+    out, used_codec = _open_video_writer(output_path, fps, size)
+    frames = 0
     try:
-        print(f"Using codec: {used_codec[0]} ({used_codec[1]})")
         # Write each frame to video
-        for image_path in image_files:
-            frame = cv2.imread(image_path)
+        for frame in _prefetch_frames(image_files, size, workers=workers):
             if frame is not None:
                 out.write(frame)
+                frames += 1
     finally:
         # Make sure to release the VideoWriter
         out.release()
+    return frames, used_codec
+
+
+def write_webm(image_files, output_path, fps=30, size=None, workers=None):
+    """Encode `image_files` into a video at `output_path`.
+
+    Frames are resized to `size`, or to the newest image's size if not given.
+    Returns a tuple of (frames written, (width, height)).
+    """
+    if size is None:
+        size = _frame_size(image_files[-1])
+
+    frames, used_codec = _encode_video(image_files, output_path, fps, size, workers=workers)
+    print(f"Using codec: {used_codec[0]} ({used_codec[1]})")
+    return frames, size
+
+
+# Chunks shorter than this aren't worth a process of their own
+MIN_SEGMENT_FRAMES = 50
+
+
+def write_webm_parallel(image_files, output_path, fps=30, size=None, processes=None, workers=None):
+    """Encode `image_files` in contiguous chunks, one process per chunk,
+    and join the segments into `output_path` without re-encoding.
+
+    Each segment goes through the usual codec fallback list; joining needs
+    every segment to have ended up with the same codec, and ffmpeg.
+    Returns a tuple of (frames written, (width, height)).
+    """
+    processes = max(1, processes or os.cpu_count() or 1)
+    chunks = min(processes, len(image_files) // MIN_SEGMENT_FRAMES)
+    if chunks < 2 or shutil.which("ffmpeg") is None:
+        if chunks >= 2:
+            print("⚠️ ffmpeg not found; encoding on a single process")
+        return write_webm(image_files, output_path, fps=fps, size=size, workers=workers)
+
+    if size is None:
+        size = _frame_size(image_files[-1])
+    # Share the decode threads between the encoder processes
+    workers = max(1, (workers or os.cpu_count() or 1) // chunks)
+    bounds = [round(i * len(image_files) / chunks) for i in range(chunks + 1)]
+    parts_dir = output_path + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    root, ext = os.path.splitext(os.path.basename(output_path))
+    segment_paths = [os.path.join(parts_dir, f"{root}_{i:03d}{ext}") for i in range(chunks)]
+    try:
+        print(f"Encoding {len(image_files)} frames in {chunks} segments on {chunks} processes")
+        # spawn rather than fork: forking a process that already runs
+        # OpenCV/decoder threads can deadlock the children
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=chunks, mp_context=context) as pool:
+            futures = [
+                pool.submit(_encode_video, image_files[bounds[i]:bounds[i + 1]], segment_paths[i], fps, size, workers)
+                for i in range(chunks)
+            ]
+            results = [future.result() for future in futures]
+
+        codecs = {codec for _, codec in results}
+        if len(codecs) > 1:
+            raise RuntimeError(f"Segments were encoded with different codecs ({codecs}); cannot join them")
+        code, human = codecs.pop()
+        print(f"Using codec: {code} ({human})")
+        concat_videos(segment_paths, output_path)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return sum(frames for frames, _ in results), size
+
+
+def concat_videos(segment_paths, output_path):
+    """Join video segments into `output_path` without re-encoding them.
+
+    All segments must share the same codec and frame size. Uses ffmpeg's
+    concat demuxer with stream copy, so the cost is a file copy.
+    """
+    if len(segment_paths) == 1:
+        shutil.copyfile(segment_paths[0], output_path)
+        return output_path
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError(
+            "ffmpeg is required to join video segments. "
+            "Install it with: sudo apt install -y ffmpeg"
+        )
+
+    list_path = output_path + ".txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", output_path],
+            check=True,
+        )
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def create_webm(fps=None, workers=None, processes=None, camera=None):
+    """
+    Create a WebM video from all images in the specified directory.
+    
+    Args:
+        fps (int): Frames per second for the output video (default: settings)
+        workers (int): Number of decode threads (default: settings, else CPU count)
+        processes (int): Encoder processes; above 1 the frames are encoded
+            as parallel segments and joined (default: settings, else 1)
+        camera (int): Camera whose series to render (default: settings)
+    """
+    settings = get_settings()
+    camera = get_camera() if camera is None else camera
+    fps = fps or settings.webm_fps
+    workers = workers or settings.decode_workers
+    processes = processes or settings.encode_processes
+    ensure_videos_dir()
+
+    rows = select_photos(camera=camera)
+    image_files = [row["photo_path"] for row in rows]
+    size = source_size(rows)
+
+    # Create output path
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    filename = f"timelapse{camera_suffix(camera)}_{timestamp}.webm"
+    output_path = os.path.join(settings.videos_dir, filename)
+
+    if processes > 1:
+        write_webm_parallel(image_files, output_path, fps=fps, size=size, processes=processes, workers=workers)
+    else:
+        write_webm(image_files, output_path, fps=fps, size=size, workers=workers)
     
     print(f"Created WebM video: {output_path}")
     return output_path
 
-def create_gif(gif_ms=150):
+def _peak_rss_mb():
+    """Return the peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def _fit_size(src_size, max_size):
+    """Scale `src_size` down to fit inside `max_size`, keeping the aspect ratio."""
+    if not max_size:
+        return src_size
+    width, height = src_size
+    scale = min(max_size[0] / width, max_size[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _load_gif_frame(path, size=None, colors=256):
+    """Decode, resize and quantize a single image into a palette GIF frame."""
+    with Image.open(path) as im:
+        if size:
+            # Let the JPEG decoder scale down while decoding (DCT scaling)
+            # instead of materialising the full resolution image first.
+            im.draft("RGB", size)
+        frame = im.convert("RGB")
+    if size and frame.size != tuple(size):
+        frame = frame.resize(size, Image.Resampling.LANCZOS)
+    return frame.quantize(colors=colors, dither=Image.Dither.FLOYDSTEINBERG)
+
+
+def write_gif(image_files, output_path, gif_ms=150, size=None, stride=1, colors=256, frame_size=None):
+    """Stream `image_files` into an animated GIF one frame at a time.
+
+    Each frame is decoded, quantized to its own palette and appended to the
+    file straight away, so only a single frame is ever held in memory.
+    Frames are resized to `frame_size` if given, otherwise to the first
+    frame's size scaled to fit inside `size`.
+
+    Returns a tuple of (frames written, (width, height)).
+    """
+    frames = 0
+    out_size = tuple(frame_size) if frame_size else None
+    with open(output_path, "wb") as fp:
+        for image_path in image_files[::max(1, stride)]:
+            if out_size is None:
+                with Image.open(image_path) as im:
+                    out_size = _fit_size(im.size, size)
+            frame = _load_gif_frame(image_path, out_size, colors)
+            if frames == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0, "duration": gif_ms})
+                for block in header:
+                    fp.write(block)
+            # Every frame carries a local colour table, so frames never have
+            # to share (or be held in memory for) one global palette.
+            for block in GifImagePlugin.getdata(frame, include_color_table=True, duration=gif_ms):
+                fp.write(block)
+            frames += 1
+        fp.write(b";")  # GIF trailer
+    return frames, out_size
+
+
+def create_gif(gif_ms=None, size=None, stride=None, camera=None):
+    """
+    Create an animated GIF from all images in the photos directory.
+
+    Frames are streamed to disk, so peak memory stays flat regardless of
+    how many photos there are.
+
+    Args:
+        gif_ms (int): Duration for each frame in milliseconds
+        size (tuple): Optional (width, height) bounding box for the output
+        stride (int): Only use every Nth photo
+        camera (int): Camera whose series to render
+
+    Unset arguments come from the settings (see config.get_settings).
+    """
+    settings = get_settings()
+    gif_ms = gif_ms or settings.gif_ms
+    size = size or settings.gif_size
+    stride = stride or settings.gif_stride
+    camera = get_camera() if camera is None else camera
     ensure_gifs_dir()  # Ensure the output directory exists
 
-    # Ensure the photos directory exists
-    if not os.path.exists(PHOTOS_DIR):
-        raise ValueError(f"Photos directory does not exist: {PHOTOS_DIR}")
-        
-    # Get all image files in the directory
-    images = []
-    print("PHOTOS_DIR:", PHOTOS_DIR)
-    for filename in sorted(os.listdir(PHOTOS_DIR)):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            file_path = os.path.join(PHOTOS_DIR, filename)
-            images.append(Image.open(file_path))
-    
-    if not images:
-        raise ValueError(f"No images found in the directory: {PHOTOS_DIR}")
-    
+    rows = select_photos(camera=camera)
+    frame_size = _fit_size(source_size(rows), size)
+    image_files = proxy_paths(rows, frame_size)
+
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"gif_{timestamp}.gif"
-    output_path = os.path.join(GIFS_DIR, filename)
-    
-    # Save the GIF with enhanced quality settings
-    images[0].save(
-        output_path,
-        save_all=True,
-        append_images=images[1:],
-        duration=gif_ms,
-        loop=0,
-        optimize=False,  # Disable optimization to preserve quality
-        quality=100,     # Use maximum quality
-        colors=256,      # Use maximum color palette
-        dither=Image.Dither.FLOYDSTEINBERG  # Use high quality dithering
-    )
+    filename = f"gif{camera_suffix(camera)}_{timestamp}.gif"
+    output_path = os.path.join(settings.gifs_dir, filename)
+
+    started = time.perf_counter()
+    frames, _ = write_gif(image_files, output_path, gif_ms=gif_ms, stride=stride, frame_size=frame_size)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {frames} frames in {elapsed:.1f}s "
+          f"({frames / max(elapsed, 1e-9):.1f} frames/sec, peak RSS {_peak_rss_mb():.0f} MB)")
 
-    full_path = os.path.join(GIFS_DIR, filename)
+    full_path = os.path.join(settings.gifs_dir, filename)
     print(full_path)
     return os.path.abspath(full_path)
 
@@ -1,34 +1,49 @@
 import sqlite3
+import hashlib
+import os
 import re
-from pathlib import Path
+import threading
 from datetime import datetime
 
+from .config import get_settings
 
-BASE_DIR = Path(__file__).parent.parent
-DB_PATH = BASE_DIR / "timelapse.db"
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PHOTO_FILENAME_RE = re.compile(r'photo_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})')
+# Photos from cameras other than 0 live under photos/cam<N>/ (see storage.shard_dir)
+CAMERA_DIR_RE = re.compile(r'cam(\d+)$')
 
-def get_db():
-    """Get a database connection."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    return conn
 
+# One cached connection per thread (sqlite3 connections must not be shared
+# across threads), re-created after a fork or if the configured db_path changes.
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
 
-def init_db():
-    """Initialize the database schema."""
-    conn = get_db()
-    c = conn.cursor()
-    
+
+def _create_base_schema(c):
     c.execute("""
         CREATE TABLE IF NOT EXISTS photos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             photo_path TEXT NOT NULL UNIQUE,
             captured_at TIMESTAMP NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_size INTEGER,
+            width INTEGER,
+            height INTEGER,
+            content_hash TEXT
         )
     """)
-    
+
+    # Databases created before the photo index need the newer columns
+    existing = {row["name"] for row in c.execute("PRAGMA table_info(photos)")}
+    for column, column_type in (("file_size", "INTEGER"), ("width", "INTEGER"),
+                                ("height", "INTEGER"), ("content_hash", "TEXT")):
+        if column not in existing:
+            c.execute(f"ALTER TABLE photos ADD COLUMN {column} {column_type}")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_captured_at ON photos(captured_at)")
+
     c.execute("""
         CREATE TABLE IF NOT EXISTS ai_analysis (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,25 +54,302 @@ def init_db():
             FOREIGN KEY(photo_id) REFERENCES photos(id)
         )
     """)
-    
-    conn.commit()
-    conn.close()
 
 
-def store_photo(photo_path, captured_at=None):
-    """Store a photo in the database. Returns the photo ID."""
+def _create_ai_cache(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            cache_key TEXT PRIMARY KEY,
+            response_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Rollup tables and the SQL expressions giving the [start, end) period a
+# capture time falls in. Weeks start on Monday. Periods cover the analyses
+# of every camera together.
+ROLLUP_PERIODS = {
+    "day": ("plant_score_daily", "date(?)", "date(?, '+1 day')"),
+    "week": ("plant_score_weekly", "date(?, 'weekday 0', '-6 days')", "date(?, 'weekday 0', '+1 day')"),
+}
+
+
+def _create_rollups(c):
+    for table, _, _ in ROLLUP_PERIODS.values():
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                period_start TEXT PRIMARY KEY,
+                analyses INTEGER NOT NULL,
+                min_score REAL,
+                max_score REAL,
+                mean_score REAL,
+                latest_description TEXT,
+                latest_captured_at TIMESTAMP
+            )
+        """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ai_analysis_analyzed_at ON ai_analysis(analyzed_at)")
+    # Filled by _detach_analyses, once analyses carry their capture time
+
+
+def _create_frame_signatures(c):
+    # dhash is the 64-bit perceptual hash stored as a signed integer
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS frame_signatures (
+            photo_id INTEGER PRIMARY KEY,
+            dhash INTEGER NOT NULL,
+            luma REAL NOT NULL,
+            sharpness REAL NOT NULL,
+            FOREIGN KEY(photo_id) REFERENCES photos(id)
+        )
+    """)
+
+
+def _create_photo_proxies(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS photo_proxies (
+            photo_id INTEGER NOT NULL,
+            scale INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            PRIMARY KEY (photo_id, scale),
+            FOREIGN KEY(photo_id) REFERENCES photos(id)
+        )
+    """)
+
+
+def _add_archived_at(c):
+    # Set when retention replaces the original with a smaller copy
+    c.execute("ALTER TABLE photos ADD COLUMN archived_at TIMESTAMP")
+
+
+def _create_metrics(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            duration_ms REAL NOT NULL,
+            ok INTEGER NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_metrics_started_at ON metrics(started_at)")
+
+
+def _create_job_runs(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT PRIMARY KEY,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP NOT NULL,
+            ok INTEGER NOT NULL,
+            error TEXT
+        )
+    """)
+
+
+def _add_camera(c):
+    # Existing photos all came from the single camera, device 0
+    c.execute("ALTER TABLE photos ADD COLUMN camera INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_camera_captured_at ON photos(camera, captured_at)")
+
+
+def _allow_unreadable_frames(c):
+    # Frames that can't be decoded get a row of NULLs, so renders don't try
+    # to decode them again. SQLite can't drop NOT NULL in place.
+    c.execute("ALTER TABLE frame_signatures RENAME TO frame_signatures_old")
+    c.execute("""
+        CREATE TABLE frame_signatures (
+            photo_id INTEGER PRIMARY KEY,
+            dhash INTEGER,
+            luma REAL,
+            sharpness REAL,
+            FOREIGN KEY(photo_id) REFERENCES photos(id)
+        )
+    """)
+    c.execute("INSERT INTO frame_signatures SELECT photo_id, dhash, luma, sharpness FROM frame_signatures_old")
+    c.execute("DROP TABLE frame_signatures_old")
+
+
+def _detach_analyses(c):
+    # Analyses keep their own capture time and outlive the photo: retention
+    # deletes old originals but the scores, rollups and charts stay.
+    c.execute("ALTER TABLE ai_analysis RENAME TO ai_analysis_old")
+    c.execute("""
+        CREATE TABLE ai_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            photo_id INTEGER UNIQUE,
+            captured_at TIMESTAMP NOT NULL,
+            description TEXT NOT NULL,
+            plant_score REAL,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(photo_id) REFERENCES photos(id)
+        )
+    """)
+    c.execute("""
+        INSERT INTO ai_analysis (id, photo_id, captured_at, description, plant_score, analyzed_at)
+        SELECT a.id, a.photo_id, p.captured_at, a.description, a.plant_score, a.analyzed_at
+        FROM ai_analysis_old a
+        JOIN photos p ON a.photo_id = p.id
+    """)
+    c.execute("DROP TABLE ai_analysis_old")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ai_analysis_analyzed_at ON ai_analysis(analyzed_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ai_analysis_captured_at ON ai_analysis(captured_at)")
+    _rebuild_rollups(c)
+
+
+# Schema migrations, applied in order. The database's `user_version` pragma
+# records how many have run, so append new steps; never edit old ones.
+MIGRATIONS = [
+    _create_base_schema,
+    _create_ai_cache,
+    _create_rollups,
+    _create_frame_signatures,
+    _create_photo_proxies,
+    _add_archived_at,
+    _create_metrics,
+    _create_job_runs,
+    _add_camera,
+    _allow_unreadable_frames,
+    _detach_analyses,
+]
+
+
+def _migrate(conn):
+    """Apply any pending schema migrations."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+    # Take the write lock before re-reading the version so concurrent
+    # processes don't run the same migration twice.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    # WAL lets the capture, render and scheduler processes read while one
+    # of them writes; NORMAL sync is durable across application crashes.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -8000")  # 8 MB
+    return conn
+
+
+def get_db():
+    """Get this thread's cached database connection.
+
+    The schema is created or migrated on first use, so callers never need
+    to initialise the database themselves.
+    """
+    path = get_settings().db_path
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key == (os.getpid(), path):
+        return conn
+
+    conn = _connect(path)
+    with _schema_lock:
+        if path not in _schema_ready:
+            _migrate(conn)
+            _schema_ready.add(path)
+    _local.conn = conn
+    _local.key = (os.getpid(), path)
+    return conn
+
+
+def close_db():
+    """Close this thread's cached connection, if any."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
+def init_db():
+    """Initialize the database schema."""
+    get_db()
+
+
+def captured_at_from_filename(photo_path):
+    """Parse the capture time from a `photo_YYYY-MM-DD_HH-MM-SS` filename, or None."""
+    match = PHOTO_FILENAME_RE.search(os.path.basename(str(photo_path)))
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y-%m-%d_%H-%M-%S")
+    except ValueError:
+        return None
+
+
+def file_hash(photo_path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(photo_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_dimensions(photo_path):
+    """Return (width, height) read from the image header, or (None, None)."""
+    try:
+        from PIL import Image
+        with Image.open(photo_path) as im:
+            return im.size
+    except Exception:
+        return None, None
+
+
+def camera_from_path(photo_path):
+    """Return the camera a photo under `photos/` belongs to, from its cam<N> directory."""
+    relative = os.path.relpath(os.path.abspath(str(photo_path)), get_settings().photos_dir)
+    match = CAMERA_DIR_RE.match(relative.split(os.sep, 1)[0])
+    return int(match.group(1)) if match else 0
+
+
+def store_photo(photo_path, captured_at=None, width=None, height=None, camera=None):
+    """Store a photo in the database. Returns the photo ID.
+
+    Records file size, dimensions and a content hash alongside the path.
+    The capture time defaults to the one encoded in the filename, then now,
+    and the camera to the one its directory belongs to.
+    """
     if captured_at is None:
-        captured_at = datetime.now()
-    
+        captured_at = captured_at_from_filename(photo_path) or datetime.now()
+    if camera is None:
+        camera = camera_from_path(photo_path)
+
+    file_size = content_hash = None
+    if os.path.exists(photo_path):
+        file_size = os.path.getsize(photo_path)
+        content_hash = file_hash(photo_path)
+        if width is None or height is None:
+            width, height = image_dimensions(photo_path)
+
     conn = get_db()
     c = conn.cursor()
     
     try:
-        c.execute(
-            "INSERT INTO photos (photo_path, captured_at) VALUES (?, ?)",
-            (str(photo_path), captured_at)
-        )
-        conn.commit()
+        with conn:
+            c.execute(
+                """INSERT INTO photos (photo_path, captured_at, file_size, width, height, content_hash, camera)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (str(photo_path), captured_at, file_size, width, height, content_hash, camera)
+            )
         photo_id = c.lastrowid
         return photo_id
     except sqlite3.IntegrityError:
@@ -65,32 +357,460 @@ def store_photo(photo_path, captured_at=None):
         c.execute("SELECT id FROM photos WHERE photo_path = ?", (str(photo_path),))
         row = c.fetchone()
         return row[0] if row else None
-    finally:
-        conn.close()
 
 
-def store_analysis(photo_id, description, plant_score=None):
-    """Store AI analysis for a photo."""
+def store_photos_bulk(rows):
+    """Insert many photos in one transaction, skipping paths already stored.
+
+    `rows` are (photo_path, captured_at, file_size, width, height, content_hash)
+    tuples; the camera comes from each path. Returns the number of rows inserted.
+    """
+    conn = get_db()
+    before = conn.total_changes
+    with conn:
+        conn.executemany(
+            """INSERT OR IGNORE INTO photos (photo_path, captured_at, file_size, width, height, content_hash, camera)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            ((*row, camera_from_path(row[0])) for row in rows)
+        )
+    return conn.total_changes - before
+
+
+def get_frame_signatures(photo_ids, chunk_size=900):
+    """Return {photo_id: (dhash, luma, sharpness)} for the photos that have one.
+
+    Photos recorded as unreadable map to None.
+    """
+    conn = get_db()
+    photo_ids = list(photo_ids)
+    signatures = {}
+    for i in range(0, len(photo_ids), chunk_size):
+        chunk = photo_ids[i:i + chunk_size]
+        rows = conn.execute(
+            f"""SELECT photo_id, dhash, luma, sharpness FROM frame_signatures
+                WHERE photo_id IN ({','.join('?' * len(chunk))})""",
+            chunk,
+        )
+        for row in rows:
+            signatures[row[0]] = None if row[1] is None else (row[1], row[2], row[3])
+    return signatures
+
+
+def store_frame_signatures(rows):
+    """Store (photo_id, dhash, luma, sharpness) rows in one transaction.
+
+    A row of (photo_id, None, None, None) records an unreadable photo.
+    """
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO frame_signatures (photo_id, dhash, luma, sharpness) VALUES (?, ?, ?, ?)",
+            rows
+        )
+
+
+def store_proxies(rows):
+    """Store (photo_id, scale, path, width, height) proxy rows in one transaction."""
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO photo_proxies (photo_id, scale, path, width, height) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def get_proxies(photo_ids, chunk_size=900):
+    """Return {photo_id: [(scale, path, width, height), ...]} ordered smallest proxy first."""
+    conn = get_db()
+    photo_ids = list(photo_ids)
+    proxies = {}
+    for i in range(0, len(photo_ids), chunk_size):
+        chunk = photo_ids[i:i + chunk_size]
+        rows = conn.execute(
+            f"""SELECT photo_id, scale, path, width, height FROM photo_proxies
+                WHERE photo_id IN ({','.join('?' * len(chunk))})
+                ORDER BY photo_id, scale DESC""",
+            chunk,
+        )
+        for row in rows:
+            proxies.setdefault(row[0], []).append((row[1], row[2], row[3], row[4]))
+    return proxies
+
+
+def get_photos_without_proxies(limit=None):
+    """Get photos that have no proxies yet, oldest first."""
     conn = get_db()
     c = conn.cursor()
-    
-    try:
-        c.execute(
-            "INSERT INTO ai_analysis (photo_id, description, plant_score) VALUES (?, ?, ?)",
-            (photo_id, description, plant_score)
+
+    c.execute("""
+        SELECT p.id, p.photo_path, p.captured_at
+        FROM photos p
+        WHERE NOT EXISTS (SELECT 1 FROM photo_proxies x WHERE x.photo_id = p.id)
+        ORDER BY p.captured_at
+        LIMIT ?
+    """, (-1 if limit is None else limit,))
+
+    return [dict(row) for row in c.fetchall()]
+
+
+def ensure_content_hash(photo_id, photo_path):
+    """Return a photo's content hash, computing and storing it if missing."""
+    conn = get_db()
+    row = conn.execute("SELECT content_hash FROM photos WHERE id = ?", (photo_id,)).fetchone()
+    if row and row["content_hash"]:
+        return row["content_hash"]
+    content_hash = file_hash(photo_path)
+    with conn:
+        conn.execute("UPDATE photos SET content_hash = ? WHERE id = ?", (content_hash, photo_id))
+    return content_hash
+
+
+def get_cached_response(cache_key):
+    """Return a cached AI response for `cache_key`, or None."""
+    conn = get_db()
+    row = conn.execute("SELECT response_text FROM ai_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+    return row["response_text"] if row else None
+
+
+def store_cached_response(cache_key, response_text):
+    """Cache an AI response under `cache_key`."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_cache (cache_key, response_text) VALUES (?, ?)",
+            (cache_key, response_text)
         )
-        conn.commit()
-        return c.lastrowid
-    except sqlite3.IntegrityError:
-        # Analysis already exists for this photo, update it
-        c.execute(
-            "UPDATE ai_analysis SET description = ?, plant_score = ? WHERE photo_id = ?",
-            (description, plant_score, photo_id)
+
+
+def get_indexed_paths():
+    """Return the set of all photo paths in the database."""
+    conn = get_db()
+    return {row[0] for row in conn.execute("SELECT photo_path FROM photos")}
+
+
+def get_latest_photo_row(camera=None):
+    """Get the most recently captured photo (of `camera`, if given) as a dict, or None."""
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute("""
+        SELECT id, photo_path, captured_at, camera
+        FROM photos
+        WHERE ? IS NULL OR camera = ?
+        ORDER BY captured_at DESC
+        LIMIT 1
+    """, (camera, camera))
+
+    row = c.fetchone()
+    return dict(row) if row else None
+
+
+def get_photos_in_range(start=None, end=None, after_id=None, camera=None):
+    """Get photos captured in [start, end), oldest first.
+
+    `after_id` excludes photos with an id at or below it, for callers that
+    resume from the last photo they processed. `camera` limits the result
+    to one camera's series.
+    """
+    clauses = []
+    params = []
+    if camera is not None:
+        clauses.append("camera = ?")
+        params.append(camera)
+    if start is not None:
+        clauses.append("captured_at >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("captured_at < ?")
+        params.append(end)
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute(f"""
+        SELECT id, photo_path, captured_at, camera, width, height
+        FROM photos
+        {where}
+        ORDER BY captured_at, id
+    """, params)
+
+    rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_unanalysed_photos(limit=None):
+    """Get photos that have no AI analysis yet, oldest first."""
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute("""
+        SELECT p.id, p.photo_path, p.captured_at, p.camera
+        FROM photos p
+        LEFT JOIN ai_analysis a ON a.photo_id = p.id
+        WHERE a.id IS NULL
+        ORDER BY p.captured_at
+        LIMIT ?
+    """, (-1 if limit is None else limit,))
+
+    rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+
+def reconcile_photos(photos_dir):
+    """Bring the photos table in line with the files under `photos_dir`.
+
+    Indexes image files that are missing from the table and removes rows
+    (and their analyses) whose files no longer exist. Rows for files
+    outside `photos_dir` (e.g. indexed in place by --ingest) are only
+    removed if the file itself is gone.
+    Returns a tuple of (added, removed).
+    """
+    on_disk = set()
+    for root, _, filenames in os.walk(photos_dir):
+        for filename in filenames:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                on_disk.add(os.path.abspath(os.path.join(root, filename)))
+
+    conn = get_db()
+    indexed = {row["photo_path"]: row["id"] for row in conn.execute("SELECT id, photo_path FROM photos")}
+
+    missing_ids = [photo_id for path, photo_id in indexed.items()
+                   if path not in on_disk and not os.path.exists(path)]
+    added = 0
+    for path in sorted(on_disk - indexed.keys()):
+        store_photo(path)
+        added += 1
+
+    delete_photos(missing_ids)
+    return added, len(missing_ids)
+
+
+def delete_photos(photo_ids, keep_analyses=False):
+    """Delete photos from the index with their analyses, signatures and proxies.
+
+    Rollups covering removed analyses are refreshed and proxy files are
+    removed; the photo files themselves are left to the caller. With
+    `keep_analyses`, analyses are detached from the photo instead, so
+    scores, rollups and charts keep covering the deleted photos.
+    """
+    ids = [(photo_id,) for photo_id in photo_ids]
+    conn = get_db()
+    with conn:
+        c = conn.cursor()
+        if keep_analyses:
+            c.executemany("UPDATE ai_analysis SET photo_id = NULL WHERE photo_id = ?", ids)
+            analysed = []
+        else:
+            # Capture times of removed analyses, whose rollup periods change
+            analysed = [
+                row[0] for (photo_id,) in ids
+                for row in c.execute("SELECT captured_at FROM ai_analysis WHERE photo_id = ?", (photo_id,))
+            ]
+            c.executemany("DELETE FROM ai_analysis WHERE photo_id = ?", ids)
+        c.executemany("DELETE FROM frame_signatures WHERE photo_id = ?", ids)
+        proxy_files = [
+            row[0] for (photo_id,) in ids
+            for row in c.execute("SELECT path FROM photo_proxies WHERE photo_id = ?", (photo_id,)).fetchall()
+        ]
+        c.executemany("DELETE FROM photo_proxies WHERE photo_id = ?", ids)
+        c.executemany("DELETE FROM photos WHERE id = ?", ids)
+        _refresh_rollups(c, analysed)
+    for path in proxy_files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _under(directory):
+    """Return the path prefix of files inside `directory`, or None for no limit."""
+    return os.path.abspath(directory).rstrip(os.sep) + os.sep if directory else None
+
+
+def get_photos_to_archive(before=None, limit=None, under=None):
+    """Get photos whose originals haven't been archived, oldest first.
+
+    Only photos captured before `before` and stored inside the directory
+    `under` are returned, if given.
+    """
+    prefix = _under(under)
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute("""
+        SELECT id, photo_path, captured_at, file_size, width, height, content_hash
+        FROM photos
+        WHERE archived_at IS NULL AND (? IS NULL OR captured_at < ?)
+          AND (? IS NULL OR substr(photo_path, 1, length(?)) = ?)
+        ORDER BY captured_at
+        LIMIT ?
+    """, (before, before, prefix, prefix, prefix, -1 if limit is None else limit))
+
+    return [dict(row) for row in c.fetchall()]
+
+
+def get_oldest_photos(limit, before=None, under=None, archived=False):
+    """Get the oldest indexed photos, only those captured before `before`
+    and stored inside the directory `under` if given. With `archived`,
+    only photos whose originals were already archived are returned."""
+    prefix = _under(under)
+    conn = get_db()
+    rows = conn.execute(
+        """SELECT id, photo_path, captured_at FROM photos
+           WHERE (? IS NULL OR captured_at < ?)
+             AND (? IS NULL OR substr(photo_path, 1, length(?)) = ?)
+             AND (? = 0 OR archived_at IS NOT NULL)
+           ORDER BY captured_at LIMIT ?""",
+        (before, before, prefix, prefix, prefix, int(archived), limit)
+    )
+    return [dict(row) for row in rows]
+
+
+def store_archived_photo(photo_id, file_size, width, height, content_hash, max_proxy_scale):
+    """Record that a photo's file was replaced by a smaller copy.
+
+    Proxies at `max_proxy_scale` or less are no smaller than the new file,
+    so their rows are dropped; returns their paths for the caller to remove.
+    """
+    conn = get_db()
+    with conn:
+        conn.execute(
+            """UPDATE photos SET file_size = ?, width = ?, height = ?, content_hash = ?,
+                                 archived_at = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            (file_size, width, height, content_hash, photo_id)
         )
-        conn.commit()
-        return photo_id
-    finally:
-        conn.close()
+        paths = [row[0] for row in conn.execute(
+            "SELECT path FROM photo_proxies WHERE photo_id = ? AND scale <= ?", (photo_id, max_proxy_scale)
+        )]
+        conn.execute("DELETE FROM photo_proxies WHERE photo_id = ? AND scale <= ?", (photo_id, max_proxy_scale))
+    return paths
+
+
+def store_metrics(rows, keep_before=None):
+    """Store (run_id, command, stage, started_at, duration_ms, ok) span rows.
+
+    Spans that started before `keep_before` are deleted in the same
+    transaction, so the table doesn't grow forever.
+    """
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            """INSERT INTO metrics (run_id, command, stage, started_at, duration_ms, ok)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        if keep_before is not None:
+            conn.execute("DELETE FROM metrics WHERE started_at < ?", (keep_before,))
+
+
+def get_metrics_since(start):
+    """Return (stage, duration_ms, ok) for every span started since `start`."""
+    conn = get_db()
+    return conn.execute(
+        "SELECT stage, duration_ms, ok FROM metrics WHERE started_at >= ? ORDER BY stage",
+        (start,)
+    ).fetchall()
+
+
+def store_job_run(job, started_at, finished_at, ok, error=None):
+    """Record the latest run of a scheduler job."""
+    conn = get_db()
+    with conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO job_runs (job, started_at, finished_at, ok, error)
+               VALUES (?, ?, ?, ?, ?)""",
+            (job, started_at, finished_at, int(ok), error)
+        )
+
+
+def get_job_runs():
+    """Return {job: row} with the latest run of each scheduler job."""
+    conn = get_db()
+    return {row["job"]: dict(row) for row in conn.execute("SELECT * FROM job_runs")}
+
+
+def _refresh_rollups(c, captured_ats):
+    """Recompute the daily and weekly rollup rows covering `captured_ats`.
+
+    Each affected period is re-aggregated from its own analyses (a range
+    scan on the ai_analysis captured_at index), so cost depends on the period's size,
+    not on the whole history.
+    """
+    for table, start_expr, end_expr in ROLLUP_PERIODS.values():
+        periods = set()
+        for captured_at in captured_ats:
+            periods.add(c.execute(f"SELECT {start_expr}, {end_expr}", (captured_at, captured_at)).fetchone())
+        for start, end in periods:
+            c.execute(f"DELETE FROM {table} WHERE period_start = ?", (start,))
+            c.execute(f"""
+                INSERT INTO {table} (period_start, analyses, min_score, max_score, mean_score,
+                                     latest_description, latest_captured_at)
+                SELECT ?, COUNT(*), MIN(a.plant_score), MAX(a.plant_score), AVG(a.plant_score),
+                       (SELECT a2.description
+                        FROM ai_analysis a2
+                        WHERE a2.captured_at >= ? AND a2.captured_at < ?
+                        ORDER BY a2.captured_at DESC
+                        LIMIT 1),
+                       MAX(a.captured_at)
+                FROM ai_analysis a
+                WHERE a.captured_at >= ? AND a.captured_at < ?
+                HAVING COUNT(*) > 0
+            """, (start, start, end, start, end))
+
+
+def _rebuild_rollups(c):
+    for table, _, _ in ROLLUP_PERIODS.values():
+        c.execute(f"DELETE FROM {table}")
+    # One capture time per day is enough to name every day and week
+    c.execute("SELECT MIN(captured_at) FROM ai_analysis GROUP BY date(captured_at)")
+    captured_ats = [row[0] for row in c.fetchall()]
+    _refresh_rollups(c, captured_ats)
+    return len(captured_ats)
+
+
+def rebuild_rollups():
+    """Recompute all plant score rollups from the raw analyses.
+
+    Returns the number of days with analyses.
+    """
+    conn = get_db()
+    with conn:
+        return _rebuild_rollups(conn.cursor())
+
+
+def store_analysis(photo_id, description, plant_score=None):
+    """Store AI analysis for a photo and update its daily/weekly rollups.
+
+    Returns None if the photo is no longer indexed.
+    """
+    conn = get_db()
+    c = conn.cursor()
+
+    with conn:
+        row = c.execute("SELECT captured_at FROM photos WHERE id = ?", (photo_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            c.execute(
+                "INSERT INTO ai_analysis (photo_id, captured_at, description, plant_score) VALUES (?, ?, ?, ?)",
+                (photo_id, row[0], description, plant_score)
+            )
+            result = c.lastrowid
+        except sqlite3.IntegrityError:
+            # Analysis already exists for this photo, update it
+            c.execute(
+                "UPDATE ai_analysis SET description = ?, plant_score = ? WHERE photo_id = ?",
+                (description, plant_score, photo_id)
+            )
+            result = photo_id
+        # Same transaction, so readers never see analyses and rollups disagree
+        _refresh_rollups(c, [row[0]])
+    return result
 
 
 def extract_plant_score(description):
@@ -122,50 +842,110 @@ def get_latest_analysis():
     c = conn.cursor()
     
     c.execute("""
-        SELECT p.photo_path, p.captured_at, a.description, a.plant_score, a.analyzed_at
+        SELECT p.photo_path, a.captured_at, a.description, a.plant_score, a.analyzed_at
         FROM ai_analysis a
-        JOIN photos p ON a.photo_id = p.id
+        LEFT JOIN photos p ON a.photo_id = p.id
         ORDER BY a.analyzed_at DESC
         LIMIT 1
     """)
     
     row = c.fetchone()
-    conn.close()
     return dict(row) if row else None
 
 
 def get_analyses_since(days_ago=7):
-    """Get all AI analyses from the past N days."""
+    """Get all AI analyses from the past N days, newest first.
+
+    Returns individual analyses (descriptions, photo paths), which rollups
+    don't keep; the analyzed_at index limits the read to the window. For
+    scores over time use get_plant_score_rollups().
+    """
     conn = get_db()
     c = conn.cursor()
     
     c.execute("""
-        SELECT p.photo_path, p.captured_at, a.description, a.plant_score, a.analyzed_at
+        SELECT p.photo_path, a.captured_at, a.description, a.plant_score, a.analyzed_at
         FROM ai_analysis a
-        JOIN photos p ON a.photo_id = p.id
+        LEFT JOIN photos p ON a.photo_id = p.id
         WHERE a.analyzed_at >= datetime('now', '-' || ? || ' days')
         ORDER BY a.analyzed_at DESC
     """, (days_ago,))
     
     rows = c.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
 
 
+def get_plant_score_rollups(period="day", start=None, end=None):
+    """Get daily or weekly plant score rollups for periods starting in [start, end), oldest first.
+
+    `period` is "day" or "week". Reads the rollup tables, so the cost
+    depends on the number of periods rather than the number of analyses.
+    """
+    table = ROLLUP_PERIODS[period][0]
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append("period_start >= ?")
+        params.append(str(start)[:10])
+    if end is not None:
+        clauses.append("period_start < ?")
+        params.append(str(end)[:10])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute(f"""
+        SELECT period_start, analyses, min_score, max_score, mean_score,
+               latest_description, latest_captured_at
+        FROM {table}
+        {where}
+        ORDER BY period_start
+    """, params)
+
+    return [dict(row) for row in c.fetchall()]
+
+
 def get_plant_score_history(limit=30):
-    """Get plant score history for charting/analysis."""
+    """Get the daily plant score rollups of the last `limit` days with analyses, newest first."""
     conn = get_db()
     c = conn.cursor()
     
     c.execute("""
-        SELECT p.captured_at, a.plant_score
-        FROM ai_analysis a
-        JOIN photos p ON a.photo_id = p.id
-        WHERE a.plant_score IS NOT NULL
-        ORDER BY p.captured_at DESC
+        SELECT period_start, analyses, min_score, max_score, mean_score, latest_description
+        FROM plant_score_daily
+        WHERE mean_score IS NOT NULL
+        ORDER BY period_start DESC
         LIMIT ?
     """, (limit,))
     
     rows = c.fetchall()
-    conn.close()
     return [dict(row) for row in rows]
+
+
+def get_plant_score_series(start=None, end=None):
+    """Get (day, plant_score) pairs for photos captured in [start, end), oldest first.
+
+    `day` is the capture time as a fractional Julian day, computed by SQLite
+    so callers don't parse a timestamp string per row.
+    """
+    clauses = ["a.plant_score IS NOT NULL"]
+    params = []
+    if start is not None:
+        clauses.append("a.captured_at >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("a.captured_at < ?")
+        params.append(end)
+
+    conn = get_db()
+    c = conn.cursor()
+
+    c.execute(f"""
+        SELECT julianday(a.captured_at) AS day, a.plant_score
+        FROM ai_analysis a
+        WHERE {' AND '.join(clauses)}
+        ORDER BY a.captured_at
+    """, params)
+
+    return [(row[0], row[1]) for row in c.fetchall()]
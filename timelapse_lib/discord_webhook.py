@@ -1,40 +1,255 @@
+"""Discord webhook delivery.
+
+Messages are written to an on-disk spool and sent by a background thread,
+so callers return as soon as a message is queued. The sender reuses one
+HTTP session, honours Discord's rate-limit headers, backs off on errors
+and merges consecutive messages for the same channel into one post.
+Anything still queued when the process exits is sent by the next run.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
 import requests
-from timelapse_lib.config import get_photo_webhook_url, get_ai_webhook_url
-from .gemini import send_to_gemini
+from timelapse_lib.config import get_settings, get_photo_webhook_url, get_ai_webhook_url
+from timelapse_lib.metrics import span
+
+MAX_CONTENT_LENGTH = 2000  # Discord's message length limit
+MIN_BACKOFF = 1  # seconds before the first retry; doubles up to MAX_BACKOFF
+MAX_BACKOFF = 300
+FLUSH_TIMEOUT = 30  # seconds to keep sending at exit before leaving the rest spooled
+
+WEBHOOK_URLS = {
+    "photo": get_photo_webhook_url,
+    "ai": get_ai_webhook_url,
+}
+
+_session = None
+_sender = None
+_sender_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _spool_dir():
+    return os.path.join(get_settings().spool_dir, "discord")
+
+
+def _failed_dir():
+    return os.path.join(_spool_dir(), "failed")
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
 
 def _execute_webhook(webhook_url, message, file_path=None):
-    """Internal helper to handle the actual network request."""
+    """Internal helper to handle the actual network request.
+
+    Returns the response, or None if there was nothing to send to.
+    """
     if not webhook_url:
         print(f"⚠️ Webhook URL missing. Cannot send: {message[:30]}")
-        return
+        return None
 
     data = {"content": message}
     files = None
 
     try:
-        if file_path:
+        if file_path and os.path.exists(file_path):
             files = {"file": open(file_path, "rb")}
-        
-        response = requests.post(webhook_url, data=data, files=files, timeout=10)
-        
-        if response.ok:
-            print(f"✅ Successfully posted to Discord")
-        else:
-            print(f"❌ Discord error: {response.status_code} - {response.text}")
-            
-    except Exception as e:
-        print(f"⚠️ Request error: {e}")
+        with span("discord.upload"):
+            return _get_session().post(webhook_url, data=data, files=files, timeout=(10, 120))
     finally:
         if files:
             files["file"].close()
 
 
+def _spooled():
+    """Return the queued message files, oldest first."""
+    try:
+        return sorted(f for f in os.listdir(_spool_dir()) if f.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def _load(name):
+    try:
+        with open(os.path.join(_spool_dir(), name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _next_batch():
+    """Return (spool file names, merged message) for the next post.
+
+    Consecutive messages for the same channel are merged while they fit in
+    one Discord message; only the last one in a batch may carry a file.
+    """
+    names = []
+    merged = None
+    for name in _spooled():
+        message = _load(name)
+        if message is None:
+            _park([name])
+            continue
+        if merged is None:
+            names.append(name)
+            merged = dict(message)
+        elif (message["channel"] == merged["channel"] and not merged.get("file_path")
+                and len(merged["content"]) + 1 + len(message["content"]) <= MAX_CONTENT_LENGTH):
+            names.append(name)
+            merged["content"] += "\n" + message["content"]
+            merged["file_path"] = message.get("file_path")
+        else:
+            break
+        if merged.get("file_path"):
+            break
+    return names, merged
+
+
+def _retry_after(response):
+    """Seconds Discord asked us to wait, from headers or the JSON body."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        try:
+            value = response.json().get("retry_after")
+        except ValueError:
+            value = None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _park(names):
+    """Move messages that can never be delivered to the failed directory."""
+    for name in names:
+        os.replace(os.path.join(_spool_dir(), name), os.path.join(_failed_dir(), name))
+
+
+def _drain():
+    """Send spooled messages until the spool is empty."""
+    backoff = MIN_BACKOFF
+    while True:
+        names, message = _next_batch()
+        if not names:
+            return
+
+        url = WEBHOOK_URLS.get(message["channel"], lambda: None)()
+        try:
+            response = _execute_webhook(url, message["content"], message.get("file_path"))
+        except requests.RequestException as e:
+            print(f"⚠️ Request error: {e}; retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            continue
+        except Exception as e:
+            # e.g. an unreadable attachment: retrying won't help, and an
+            # uncaught error would stop the sender for the whole run
+            print(f"❌ Could not send Discord message: {e}")
+            _park(names)
+            continue
+
+        if response is None or response.ok:
+            if response is not None:
+                print(f"✅ Successfully posted to Discord")
+            for name in names:
+                os.remove(os.path.join(_spool_dir(), name))
+            backoff = MIN_BACKOFF
+            # Respect the bucket before it runs dry rather than after a 429
+            if response is not None and response.headers.get("X-RateLimit-Remaining") == "0":
+                time.sleep(float(response.headers.get("X-RateLimit-Reset-After", 1)))
+        elif response.status_code == 429:
+            delay = _retry_after(response)
+            print(f"⏳ Discord rate limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+        elif response.status_code >= 500:
+            print(f"❌ Discord error: {response.status_code}; retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+        else:
+            # Retrying won't help; park the messages for inspection
+            print(f"❌ Discord error: {response.status_code} - {response.text}")
+            _park(names)
+
+
+def _sender_loop():
+    # Only one process drains the spool at a time; others just enqueue.
+    with open(os.path.join(_spool_dir(), ".lock"), "a") as lock_file:
+        while True:
+            _wakeup.wait(timeout=5)
+            _wakeup.clear()
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                _drain()
+            except Exception as e:
+                print(f"⚠️ Discord sender error: {e}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _ensure_sender():
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            os.makedirs(_failed_dir(), exist_ok=True)
+            _sender = threading.Thread(target=_sender_loop, name="discord-sender", daemon=True)
+            _sender.start()
+            atexit.register(flush)
+    _wakeup.set()
+
+
+def enqueue_message(channel, message, file_path=None):
+    """Queue a message for `channel` ("photo" or "ai") and return immediately."""
+    os.makedirs(_failed_dir(), exist_ok=True)
+    name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+    path = os.path.join(_spool_dir(), name)
+    payload = {
+        "channel": channel,
+        "content": message,
+        "file_path": os.path.abspath(file_path) if file_path else None,
+        "queued_at": datetime.now().isoformat(),
+    }
+    # Write then rename so the sender never sees a half-written message
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+    _ensure_sender()
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """Wait up to `timeout` seconds for the spool to drain.
+
+    Returns True if everything was sent. Unsent messages stay spooled.
+    """
+    deadline = time.monotonic() + timeout
+    while _spooled():
+        if time.monotonic() >= deadline:
+            print(f"⚠️ {len(_spooled())} Discord messages still queued; they will be sent next run")
+            return False
+        _wakeup.set()
+        time.sleep(0.1)
+    return True
+
+
 def send_discord_message_in_photo_channel(message, file_path=None):
-    url = get_photo_webhook_url()
-    _execute_webhook(url, message, file_path)
+    enqueue_message("photo", message, file_path)
 
 def send_discord_message_in_ai_channel(message, file_path=None):
-    url = get_ai_webhook_url()
+    from .gemini import send_to_gemini  # loads the Gemini SDK, only needed here
+
     message = send_to_gemini()
     message = f"🤖 AI Analysis:\n```json\n{message}\n```"
-    _execute_webhook(url, message, file_path)
\ No newline at end of file
+    enqueue_message("ai", message, file_path)
@@ -1,15 +1,9 @@
 import shutil
 
-def get_free_space_gb_str(path: str) -> str:
-    
-    # Get disk usage statistics
-    disk_stats = shutil.disk_usage(path)
-
-    # Access the 'free' attribute for available space in bytes
-    free_bytes = disk_stats.free
+def get_free_space_gb(path: str) -> float:
+    """Return the free disk space on the given path in gigabytes."""
+    return shutil.disk_usage(path).free / (1024**3)
 
-    # Convert bytes to a more readable unit, such as gigabytes
-    free_gigabytes = free_bytes / (1024**3)
-
-    return (f"Free space on '{path}': {free_gigabytes:.2f} GB")
-    """Return a human-readable string of free disk space on the given path."""
\ No newline at end of file
+def get_free_space_gb_str(path: str) -> str:
+    """Return a human-readable string of free disk space on the given path."""
+    return (f"Free space on '{path}': {get_free_space_gb(path):.2f} GB")
@@ -0,0 +1,114 @@
+"""Skip dark, blown-out, blurry and duplicate frames before rendering.
+
+Each photo gets a compact signature the first time it is rendered: a
+64-bit difference hash, mean luminance and sharpness, computed on the 1/8
+scale image the JPEG decoder produces directly. Signatures are stored in
+the database, so later renders filter frames without decoding any images.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .capture import frame_stats
+from .config import get_settings
+from .database import get_frame_signatures, store_frame_signatures
+
+HASH_SIZE = 8
+# Frames within this many luminance levels and hash bits of the last kept
+# frame are treated as duplicates
+DUPLICATE_LUMA = 1.0
+
+
+def _dhash(gray):
+    """Return the 64-bit difference hash of a grayscale image as a signed int."""
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">i8")[0])
+
+
+def compute_signature(path):
+    """Return (dhash, luma, sharpness) of an image, or None if it can't be read."""
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None:
+        return None
+    luma, sharpness = frame_stats(gray)
+    return _dhash(gray), luma, sharpness
+
+
+def ensure_signatures(rows, workers=None):
+    """Return {photo_id: (dhash, luma, sharpness)}, computing and storing missing ones.
+
+    Photos that can't be decoded map to None and are recorded as such, so
+    later renders skip them without trying again.
+    """
+    signatures = get_frame_signatures(row["id"] for row in rows)
+    missing = [row for row in rows if row["id"] not in signatures]
+    if missing:
+        workers = max(1, workers or os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            computed = list(pool.map(compute_signature, (row["photo_path"] for row in missing)))
+        store_frame_signatures([(row["id"], *(sig or (None, None, None))) for row, sig in zip(missing, computed)])
+        signatures.update((row["id"], sig) for row, sig in zip(missing, computed))
+        unreadable = computed.count(None)
+        print(f"Computed {len(missing) - unreadable} frame signatures ({unreadable} unreadable)")
+    return signatures
+
+
+def filter_params():
+    """Return the filter thresholds in use, or None if filtering is off."""
+    settings = get_settings()
+    if not settings.frame_filter:
+        return None
+    return {
+        "min_luma": settings.filter_min_luma,
+        "max_luma": settings.filter_max_luma,
+        "blur_ratio": settings.filter_blur_ratio,
+        "duplicate_bits": settings.filter_duplicate_bits,
+    }
+
+
+def select_frames(rows, previous=None):
+    """Return the photo rows worth rendering, in order.
+
+    Drops unreadable frames, frames whose mean luminance is outside
+    [min_luma, max_luma], frames whose sharpness is below `blur_ratio`
+    times the median of the well-exposed ones, and frames that match the
+    last kept frame (dHash distance and luminance). `previous` is the row
+    rendered just before `rows`, so incremental runs dedupe across runs.
+    """
+    params = filter_params()
+    if not rows or params is None:
+        return rows
+
+    signatures = ensure_signatures(rows + ([previous] if previous else []))
+    blank = (0, 0.0, 0.0)
+    known = np.array([signatures.get(row["id"]) is not None for row in rows])
+    hashes = np.array([(signatures.get(row["id"]) or blank)[0] for row in rows], dtype=np.int64)
+    luma = np.array([(signatures.get(row["id"]) or blank)[1] for row in rows], dtype=np.float64)
+    sharpness = np.array([(signatures.get(row["id"]) or blank)[2] for row in rows], dtype=np.float64)
+
+    exposed = known & (luma >= params["min_luma"]) & (luma <= params["max_luma"])
+    median = np.median(sharpness[exposed]) if exposed.any() else 0.0
+    sharp = sharpness >= params["blur_ratio"] * median
+    keep = exposed & sharp
+
+    # Duplicates depend on the last frame kept, so this pass is sequential,
+    # but it only compares integers already in memory.
+    last = signatures.get(previous["id"]) if previous else None
+    duplicates = 0
+    for i in np.flatnonzero(keep):
+        if (last is not None and abs(luma[i] - last[1]) <= DUPLICATE_LUMA
+                and bin((int(hashes[i]) ^ last[0]) & 0xFFFFFFFFFFFFFFFF).count("1") <= params["duplicate_bits"]):
+            keep[i] = False
+            duplicates += 1
+        else:
+            last = (int(hashes[i]), luma[i])
+
+    dropped = len(rows) - int(keep.sum())
+    if dropped:
+        print(f"Skipping {dropped} of {len(rows)} frames: {int((~known).sum())} unreadable, "
+              f"{int((known & ~exposed).sum())} too dark/bright, {int((exposed & ~sharp).sum())} blurry, "
+              f"{duplicates} duplicates")
+    return [row for row, kept in zip(rows, keep) if kept]
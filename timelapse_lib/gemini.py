@@ -1,64 +1,57 @@
-import os
-import base64
-import dotenv
+import hashlib
+import io
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+import httpx
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from PIL import Image
 import json
-from .database import store_photo, store_analysis, extract_plant_score
-
-def send_to_gemini():
-    dotenv.load_dotenv()
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    default_photos_dir = Path(__file__).parent.parent / "photos"
-    photos_dir = None
-    if os.getenv("PHOTO_PATH"):
-        photos_dir = Path(os.getenv("PHOTO_PATH") or "./photos").expanduser()
-    else:
-        photos_dir = default_photos_dir
-
-    # If the configured path is relative (e.g. "photos" or "./photos"),
-    # interpret it relative to the project root so cron (or other CWDs)
-    # still find the correct directory.
-    if not photos_dir.is_absolute():
-        photos_dir = (Path(__file__).parent.parent / photos_dir).resolve()
-    allowed_ext = {".jpg", ".jpeg", ".png", ".heic", ".webp"}
-    if not photos_dir.exists():
-        raise SystemExit(f"photos directory not found: {photos_dir}")
-
-    image_files = [
-        p for p in photos_dir.iterdir() if p.is_file() and p.suffix.lower() in allowed_ext
-    ]
-    if not image_files:
-        raise SystemExit(f"No image files found in {photos_dir}")
-
-    latest_image = max(image_files, key=lambda p: p.stat().st_mtime)
-
-    # Read and base64-encode the image
-    with latest_image.open("rb") as f:
-        image_bytes = f.read()
-
-    prompt_text = "Respond in JSON with 'plant_score' and 'plant_care' fields. Plant score is out of 100 and give plant-care suggestions."
-    # Build typed content objects expected by the SDK
-    import mimetypes
-
-    mime_type, _ = mimetypes.guess_type(str(latest_image))
-    if not mime_type:
-        mime_type = "image/jpeg"
-
-    text_part = types.Part.from_text(text=prompt_text)
-    image_part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-    content = types.Content(parts=[text_part, image_part])
-
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        # model="gemini-2.0-flash",
-        config={"response_mime_type": "application/json"},
-        contents=[content],
-    )
-
-    response_text = response.text
-
+from .config import get_camera, get_settings
+from .metrics import span
+from .proxies import pick_proxy
+from .database import (
+    ensure_content_hash,
+    extract_plant_score,
+    get_cached_response,
+    get_proxies,
+    get_latest_photo_row,
+    get_unanalysed_photos,
+    store_analysis,
+    store_cached_response,
+)
+
+# First retry delay in seconds; doubles with every attempt
+RETRY_DELAY = 2.0
+
+PROMPT_TEXT = "Respond in JSON with 'plant_score' and 'plant_care' fields. Plant score is out of 100 and give plant-care suggestions."
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared Gemini client, creating it on first use.
+
+    Set GEMINI_BASE_URL to point the client at another endpoint, e.g. a
+    local stub server when testing.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            settings = get_settings()
+            http_options = None
+            if settings.gemini_base_url:
+                http_options = types.HttpOptions(base_url=settings.gemini_base_url)
+            _client = genai.Client(api_key=settings.gemini_api_key, http_options=http_options)
+    return _client
+
+
+def _parse_response(response_text):
+    """Return (plant_score, description) from a Gemini response."""
     # Try to parse structured JSON response
     plant_score = None
     description = None
@@ -80,16 +73,175 @@ def send_to_gemini():
     if not description:
         description = response_text
 
-    # Ensure the photo is recorded in the DB and store the AI analysis
-    try:
-        photo_id = store_photo(latest_image)
-    except Exception:
-        photo_id = None
+    return plant_score, description
+
+
+def prepare_upload(photo_path, max_side=None, quality=None, photo_id=None):
+    """Return (bytes, mime type) of the image to upload.
+
+    Images are downscaled so their longest side is at most `max_side` and
+    re-encoded as JPEG at `quality`, which shrinks multi-MB captures to a
+    few hundred KB. `max_side` of 0 uploads the original file.
+    Defaults come from GEMINI_UPLOAD_MAX_SIDE and GEMINI_UPLOAD_QUALITY.
+    Given `photo_id`, the smallest proxy at least `max_side` is decoded
+    instead of the original.
+    """
+    settings = get_settings()
+    if max_side is None:
+        max_side = settings.upload_max_side
+    if quality is None:
+        quality = settings.upload_quality
+
+    image_path = Path(photo_path)
+    if not max_side:
+        import mimetypes
+
+        mime_type, _ = mimetypes.guess_type(str(image_path))
+        return image_path.read_bytes(), mime_type or "image/jpeg"
+
+    if photo_id is not None:
+        proxy = pick_proxy(get_proxies([photo_id]).get(photo_id), (max_side, max_side))
+        image_path = Path(proxy) if proxy else image_path
+
+    with Image.open(image_path) as im:
+        im.draft("RGB", (max_side, max_side))  # fast JPEG DCT downscaling
+        im = im.convert("RGB")
+    im.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    im.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def _cache_key(content_hash):
+    model = get_settings().gemini_model
+    return hashlib.sha256(f"{content_hash}\0{model}\0{PROMPT_TEXT}".encode()).hexdigest()
+
+
+def analyse_photo(photo_id, photo_path, client=None):
+    """Send one photo to Gemini, store the analysis and return the response text.
+
+    Responses are cached by image content hash, model and prompt, so an
+    unchanged image is never sent twice.
+    """
+    image_path = Path(photo_path)
+    cache_key = _cache_key(ensure_content_hash(photo_id, image_path))
+    response_text = get_cached_response(cache_key)
+
+    if response_text is None:
+        client = client or get_client()
+        with span("gemini.prepare_upload"):
+            image_bytes, mime_type = prepare_upload(image_path, photo_id=photo_id)
+
+        text_part = types.Part.from_text(text=PROMPT_TEXT)
+        image_part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+        content = types.Content(parts=[text_part, image_part])
+
+        with span("gemini.generate"):
+            response = client.models.generate_content(
+                model=get_settings().gemini_model,
+                # model="gemini-2.0-flash",
+                config={"response_mime_type": "application/json"},
+                contents=[content],
+            )
+
+        response_text = response.text
+        store_cached_response(cache_key, response_text)
+    else:
+        print(f"♻️ Using cached analysis for {image_path.name}")
 
-    try:
-        if photo_id is not None:
-            store_analysis(photo_id, description, plant_score=plant_score)
-    except Exception:
-        pass
+    plant_score, description = _parse_response(response_text)
+
+    # Store the AI analysis against the indexed photo
+    store_analysis(photo_id, description, plant_score=plant_score)
 
     return response_text
+
+
+def send_to_gemini(camera=None):
+    """Analyse the latest photo from `camera` (default: see config.get_camera)."""
+    latest = get_latest_photo_row(camera=get_camera() if camera is None else camera)
+    if latest is None:
+        raise SystemExit("No photos indexed in the database (try --reconcile)")
+    return analyse_photo(latest["id"], latest["photo_path"])
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second, shared across threads."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _is_retryable(error):
+    """Retry rate limiting, timeouts, server errors and connection failures.
+
+    Anything else (a missing file, an unreadable image, a rejected request)
+    fails the same way every time, so it isn't retried.
+    """
+    if isinstance(error, errors.APIError):
+        return error.code in (408, 429) or error.code >= 500
+    return isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def _analyse_with_retries(photo, limiter, retries, base_delay=None):
+    base_delay = RETRY_DELAY if base_delay is None else base_delay
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return analyse_photo(photo["id"], photo["photo_path"])
+        except Exception as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            delay = base_delay * (2 ** attempt) * (1 + random.random())
+            print(f"⚠️ {Path(photo['photo_path']).name}: {e}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def analyse_pending(concurrency=None, requests_per_minute=None, retries=4, limit=None):
+    """Analyse every photo that has no AI analysis yet.
+
+    Requests run on `concurrency` threads sharing one client, throttled to
+    `requests_per_minute` and retried with exponential backoff. Each result
+    is stored as soon as it arrives, so an interrupted run loses nothing.
+
+    Returns a tuple of (succeeded, failed).
+    """
+    settings = get_settings()
+    concurrency = concurrency or settings.ai_concurrency
+    requests_per_minute = requests_per_minute or settings.ai_rate
+    photos = get_unanalysed_photos(limit)
+    if not photos:
+        print("No photos waiting for analysis")
+        return 0, 0
+
+    get_client()  # create the shared client before the workers start
+    limiter = RateLimiter(requests_per_minute / 60.0)
+    succeeded = failed = 0
+    print(f"Analysing {len(photos)} photos with {concurrency} workers")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(_analyse_with_retries, photo, limiter, retries): photo for photo in photos}
+        for future in as_completed(futures):
+            photo = futures[future]
+            try:
+                future.result()
+                succeeded += 1
+            except Exception as e:
+                failed += 1
+                print(f"❌ {Path(photo['photo_path']).name}: {e}")
+    return succeeded, failed
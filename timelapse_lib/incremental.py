@@ -0,0 +1,275 @@
+"""Incremental timelapse rendering.
+
+Instead of re-encoding every photo on each run, encoded segments are kept
+next to a manifest recording which photos they cover. A run only encodes
+the photos added since the previous run into a new segment and then joins
+the segments into the final output, so render cost grows with the number
+of new photos rather than with the whole archive.
+
+Only the latest output is kept: the previous one is removed once the new
+one has been written. Once there are more than MAX_SEGMENTS segments they
+are merged into one, so joins never have to open thousands of files.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+
+from .attachments import _attachment_path
+from .config import get_camera, get_settings
+from .create_animation import (
+    _fit_size,
+    concat_videos,
+    source_size,
+    write_gif,
+    write_webm,
+    write_webm_parallel,
+)
+from .database import get_photos_in_range
+from .frame_filter import filter_params, select_frames
+from .proxies import proxy_paths
+from .storage import camera_suffix
+
+MANIFEST_NAME = "manifest.json"
+MAX_SEGMENTS = 32
+
+
+def _segments_dir(kind, camera):
+    settings = get_settings()
+    base = settings.videos_dir if kind == "webm" else settings.gifs_dir
+    return os.path.join(base, f"segments{camera_suffix(camera)}")
+
+
+def _load_manifest(kind, camera, params, rebuild=False):
+    """Load the segment manifest, starting fresh if the render params changed.
+
+    A fresh manifest still records the previous output, so it gets removed.
+    """
+    path = os.path.join(_segments_dir(kind, camera), MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+
+    # Manifests without last_id tracked photos by capture time; start over
+    if manifest is None or rebuild or manifest.get("params") != params or "last_id" not in manifest:
+        output = manifest.get("output") if manifest else None
+        manifest = {"params": params, "last_id": 0, "kept": 0, "size": None, "segments": [],
+                    "output": output}
+    return manifest
+
+
+def _save_manifest(kind, camera, manifest):
+    path = os.path.join(_segments_dir(kind, camera), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _reset_segments(kind, camera):
+    shutil.rmtree(_segments_dir(kind, camera), ignore_errors=True)
+
+
+def _new_photos(manifest, stride, camera):
+    """Return (rows of photos to encode, rows of all photos indexed since the last run).
+
+    Photos are picked by id rather than capture time, so ones indexed late
+    (by --ingest or --reconcile, or a second capture within the same
+    second) are still encoded, after the frames already in the output.
+    """
+    new_rows = get_photos_in_range(after_id=manifest["last_id"], camera=camera)
+
+    # Filter first, then stride over the kept frames counting across runs,
+    # in the same order as a full render
+    kept = select_frames(new_rows, previous=manifest.get("last_frame"))
+    if kept:
+        manifest["last_frame"] = {"id": kept[-1]["id"], "photo_path": kept[-1]["photo_path"]}
+    selected = [row for i, row in enumerate(kept) if (manifest["kept"] + i) % stride == 0]
+    manifest["kept"] += len(kept)
+    return selected, new_rows
+
+
+def _gif_header_length(path):
+    """Return the byte length of a GIF's header (signature, screen
+    descriptor, global colour table and looping extension)."""
+    with open(path, "rb") as f:
+        head = f.read(13)
+        flags = head[10]
+        length = 13
+        if flags & 0x80:
+            length += 3 * (2 ** ((flags & 0x07) + 1))
+        f.seek(length)
+        if f.read(3) == b"!\xff\x0b":
+            length += 19  # NETSCAPE2.0 looping extension
+    return length
+
+
+def _concat_gifs(segment_paths, output_path):
+    """Join GIF segments by keeping the first header and every segment's frames."""
+    with open(output_path, "wb") as out:
+        for i, path in enumerate(segment_paths):
+            header_length = _gif_header_length(path)
+            body_length = os.path.getsize(path) - header_length - 1  # drop trailer
+            with open(path, "rb") as f:
+                if i == 0:
+                    out.write(f.read(header_length))
+                else:
+                    f.seek(header_length)
+                remaining = body_length
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    remaining -= len(chunk)
+        out.write(b";")
+    return output_path
+
+
+def _join(kind, segment_paths, output_path):
+    if kind == "webm":
+        return concat_videos(segment_paths, output_path)
+    return _concat_gifs(segment_paths, output_path)
+
+
+def _next_segment_path(seg_dir, kind, manifest):
+    index = manifest.get("next_segment", len(manifest["segments"]) + 1)
+    manifest["next_segment"] = index + 1
+    return os.path.join(seg_dir, f"segment_{index:05d}.{kind}")
+
+
+def _compact_segments(kind, camera, manifest):
+    """Merge the segments into one once there are more than MAX_SEGMENTS.
+
+    Joining copies the encoded data without re-encoding it. The manifest
+    is saved before the old segments are removed.
+    """
+    segments = manifest["segments"]
+    if len(segments) <= MAX_SEGMENTS:
+        return
+    seg_dir = _segments_dir(kind, camera)
+    paths = [os.path.join(seg_dir, s["file"]) for s in segments]
+    merged_path = _next_segment_path(seg_dir, kind, manifest)
+    _join(kind, paths, merged_path)
+    manifest["segments"] = [{
+        "file": os.path.basename(merged_path),
+        "first": segments[0]["first"],
+        "last": segments[-1]["last"],
+        "frames": sum(s["frames"] for s in segments),
+    }]
+    _save_manifest(kind, camera, manifest)
+    for path in paths:
+        os.remove(path)
+    print(f"Merged {len(paths)} segments into {os.path.basename(merged_path)}")
+
+
+def _remove_output(path):
+    """Remove a previous output and the Discord-sized copy made from it."""
+    for stale in (path, _attachment_path(path)):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+def _render_incremental(kind, params, stride, encode, rebuild=False, camera=None):
+    """Encode new photos into a segment and join all segments into one output.
+
+    Each camera's series has its own segments and manifest.
+    """
+    camera = get_camera() if camera is None else camera
+    seg_dir = _segments_dir(kind, camera)
+    manifest = _load_manifest(kind, camera, params, rebuild=rebuild)
+    if not manifest["segments"]:
+        # Stale segments from a different configuration are useless
+        _reset_segments(kind, camera)
+    os.makedirs(seg_dir, exist_ok=True)
+
+    selected, new_rows = _new_photos(manifest, stride, camera)
+    if selected:
+        segment_path = _next_segment_path(seg_dir, kind, manifest)
+        frames, size = encode(selected, segment_path, manifest["size"])
+        if frames:
+            manifest["size"] = list(size)
+            manifest["segments"].append({
+                "file": os.path.basename(segment_path),
+                "first": selected[0]["photo_path"],
+                "last": selected[-1]["photo_path"],
+                "frames": frames,
+            })
+            print(f"Encoded {frames} new frames into {os.path.basename(segment_path)}")
+        else:
+            os.remove(segment_path)
+    else:
+        print("No new photos to encode")
+
+    if new_rows:
+        manifest["last_id"] = max(row["id"] for row in new_rows)
+
+    if not manifest["segments"]:
+        raise ValueError("No frames selected for the timelapse")
+    _compact_segments(kind, camera, manifest)
+
+    previous = output = manifest.get("output")
+    if selected or not output or not os.path.exists(output):
+        segment_paths = [os.path.join(seg_dir, s["file"]) for s in manifest["segments"]]
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        if kind == "webm":
+            output = os.path.join(get_settings().videos_dir, f"timelapse{camera_suffix(camera)}_{timestamp}.webm")
+        else:
+            output = os.path.join(get_settings().gifs_dir, f"gif{camera_suffix(camera)}_{timestamp}.gif")
+        _join(kind, segment_paths, output)
+        manifest["output"] = output
+
+    _save_manifest(kind, camera, manifest)
+    if previous and previous != output:
+        _remove_output(previous)
+    print(f"Created {kind} from {len(manifest['segments'])} segments: {output}")
+    return os.path.abspath(output)
+
+
+def render_webm_incremental(fps=None, workers=None, rebuild=False, processes=None, camera=None):
+    """Incrementally render the WebM timelapse. Returns the output path.
+
+    Joining segments needs ffmpeg, so without it this fails before
+    encoding anything.
+    """
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError(
+            "Incremental WebM rendering needs ffmpeg to join segments. "
+            "Install it with: sudo apt install -y ffmpeg, or render without --incremental"
+        )
+    settings = get_settings()
+    fps = fps or settings.webm_fps
+    workers = workers or settings.decode_workers
+    processes = processes or settings.encode_processes
+
+    def encode(rows, segment_path, size):
+        image_files = [row["photo_path"] for row in rows]
+        # Later segments must match the first one's size to be joined
+        size = size or source_size(rows)
+        if processes > 1:
+            return write_webm_parallel(image_files, segment_path, fps=fps, size=size,
+                                        processes=processes, workers=workers)
+        return write_webm(image_files, segment_path, fps=fps, size=size, workers=workers)
+
+    params = {"fps": fps, "filter": filter_params()}
+    return _render_incremental("webm", params, 1, encode, rebuild=rebuild, camera=camera)
+
+
+def render_gif_incremental(gif_ms=None, size=None, stride=None, rebuild=False, camera=None):
+    """Incrementally render the GIF timelapse. Returns the output path."""
+    settings = get_settings()
+    gif_ms = gif_ms or settings.gif_ms
+    size = size or settings.gif_size
+    stride = stride or settings.gif_stride
+
+    def encode(rows, segment_path, frame_size):
+        frame_size = frame_size or _fit_size(source_size(rows), size)
+        image_files = proxy_paths(rows, frame_size)
+        return write_gif(image_files, segment_path, gif_ms=gif_ms, frame_size=frame_size)
+
+    params = {"gif_ms": gif_ms, "size": list(size) if size else None, "stride": stride, "filter": filter_params()}
+    return _render_incremental("gif", params, max(1, stride), encode, rebuild=rebuild, camera=camera)
@@ -0,0 +1,103 @@
+"""Bulk import of existing photo archives into the photos table.
+
+Walks a directory tree, works out when each photo was taken and inserts
+the rows in large batched transactions. Files that are already indexed
+are skipped, so an interrupted import can simply be re-run.
+"""
+import os
+import time
+from datetime import datetime
+
+from .database import (
+    IMAGE_EXTENSIONS,
+    captured_at_from_filename,
+    file_hash,
+    get_indexed_paths,
+    store_photos_bulk,
+)
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+
+def _scan(root):
+    """Yield os.DirEntry objects for every image file under `root`."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry
+        except OSError as e:
+            print(f"⚠️ Skipping unreadable directory: {e}")
+
+
+def _probe(path, need_time):
+    """Read (width, height, EXIF capture time) from the image header.
+
+    Only the header is parsed; pixel data is never decoded.
+    """
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            width, height = im.size
+            taken = None
+            if need_time:
+                exif = im.getexif()
+                taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if taken:
+            taken = datetime.strptime(str(taken).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+        return width, height, taken
+    except Exception:
+        return None, None, None
+
+
+def ingest_photos(root, batch_size=5000, probe=True, with_hash=False):
+    """Index every image under `root` that isn't in the database yet.
+
+    The capture time comes from the `photo_YYYY-MM-DD_HH-MM-SS` filename,
+    then the EXIF DateTimeOriginal tag, then the file's mtime. With
+    `probe`, image dimensions are read from the file header. Hashing every
+    file is optional as it means reading all the image data.
+
+    Returns a tuple of (inserted, skipped).
+    """
+    indexed = get_indexed_paths()
+    inserted = skipped = 0
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal inserted
+        inserted += store_photos_bulk(batch)
+        batch.clear()
+        rate = inserted / max(time.perf_counter() - started, 1e-9)
+        print(f"Ingested {inserted} photos ({rate:.0f}/s)")
+
+    for entry in _scan(os.path.abspath(root)):
+        path = entry.path
+        if path in indexed:
+            skipped += 1
+            continue
+
+        st = entry.stat()
+        captured_at = captured_at_from_filename(path)
+        width = height = None
+        if probe or captured_at is None:
+            width, height, taken = _probe(path, need_time=captured_at is None)
+            captured_at = captured_at or taken
+        if captured_at is None:
+            captured_at = datetime.fromtimestamp(st.st_mtime)
+        content_hash = file_hash(path) if with_hash else None
+
+        batch.append((path, captured_at, st.st_size, width, height, content_hash))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    return inserted, skipped
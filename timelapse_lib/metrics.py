@@ -0,0 +1,112 @@
+"""Per-stage timings for every run.
+
+Wrap a stage in `with span("capture.imwrite"):` to time it. Spans are
+buffered in memory and written to the `metrics` table in one transaction
+when the run ends (or by flush(), e.g. after each daemon capture), so
+timing never adds a database write to the stage itself. With METRICS=0,
+span() returns a shared no-op context manager.
+
+`--stats` prints p50/p95 per stage from the table.
+"""
+import atexit
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from .config import get_settings
+
+# Spans older than this are dropped when new ones are written
+KEEP_DAYS = 90
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_spans = []
+_run = {"id": uuid.uuid4().hex[:12], "command": os.path.basename(sys.argv[0]) or "python"}
+_registered = False
+
+
+class _Span:
+    __slots__ = ("stage", "started_at", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        _record(self.stage, self.started_at, duration_ms, exc_type is None)
+        return False
+
+
+def span(stage):
+    """Return a context manager timing `stage`; failed stages are recorded as not ok."""
+    if not get_settings().metrics:
+        return _NOOP
+    return _Span(stage)
+
+
+def _record(stage, started_at, duration_ms, ok):
+    global _registered
+    with _lock:
+        _spans.append((_run["id"], _run["command"], stage, started_at, duration_ms, int(ok)))
+        if not _registered:
+            # Exit handlers run last-registered first, so registering early
+            # (here or in start_run) keeps spans from later ones, e.g. the
+            # Discord flush
+            atexit.register(flush)
+            _registered = True
+
+
+def start_run(command):
+    """Label the spans that follow as one run of `command`."""
+    global _registered
+    with _lock:
+        _run["id"] = uuid.uuid4().hex[:12]
+        _run["command"] = command
+        if not _registered:
+            atexit.register(flush)
+            _registered = True
+
+
+def flush():
+    """Write buffered spans to the database. Never raises."""
+    with _lock:
+        rows = _spans[:]
+        del _spans[:]
+    if not rows:
+        return
+    from .database import store_metrics
+    try:
+        store_metrics(rows, keep_before=datetime.now() - timedelta(days=KEEP_DAYS))
+    except Exception as e:
+        print(f"⚠️ Could not store {len(rows)} timing spans: {e}")
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def stage_stats(days=7):
+    """Return [(stage, count, p50_ms, p95_ms, failed)] over the last `days` days."""
+    from .database import get_metrics_since
+
+    durations = {}
+    failed = {}
+    for stage, duration_ms, ok in get_metrics_since(datetime.now() - timedelta(days=days)):
+        durations.setdefault(stage, []).append(duration_ms)
+        failed[stage] = failed.get(stage, 0) + (not ok)
+    stats = []
+    for stage, values in sorted(durations.items()):
+        values.sort()
+        stats.append((stage, len(values), _percentile(values, 50), _percentile(values, 95), failed[stage]))
+    return stats
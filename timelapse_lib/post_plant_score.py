@@ -1,91 +1,147 @@
-import sqlite3
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
-import requests
-from timelapse_lib.config import get_ai_webhook_url
+from datetime import datetime, timedelta
 import os
 
-def generate_plant_score_chart():
-    """Generate the plant score chart and return the file path."""
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'timelapse.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from timelapse_lib.config import BASE_DIR
+from timelapse_lib.database import get_plant_score_rollups, get_plant_score_series
+from timelapse_lib.discord_webhook import enqueue_message
+from timelapse_lib.metrics import span
+
+# Julian day number of the Unix epoch, to turn SQLite's julianday() into
+# matplotlib date numbers without parsing timestamps in Python
+JULIAN_UNIX_EPOCH = 2440587.5
+
+REPORT_DAYS = 7
+MAX_POINTS = 500
+# Longer windows are drawn from the daily rollups instead of raw analyses
+RAW_MAX_DAYS = 31
+FIGSIZE = (10, 5)
+DPI = 100
 
-    # Get all plant scores with timestamps
-    cursor.execute("""
-        SELECT ai_analysis.plant_score, ai_analysis.analyzed_at, photos.captured_at
-        FROM ai_analysis
-        JOIN photos ON ai_analysis.photo_id = photos.id
-        ORDER BY photos.captured_at
-    """)
 
-    rows = cursor.fetchall()
-    conn.close()
+def lttb(x, y, threshold):
+    """Downsample a series to `threshold` points with Largest-Triangle-Three-Buckets.
 
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with its neighbours, so peaks and
+    dips survive where plain striding would drop them.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def _daily_series(start):
+    """Return (days, mean, min, max) arrays from the daily rollups since `start`."""
+    rows = [r for r in get_plant_score_rollups("day", start=start) if r["mean_score"] is not None]
     if not rows:
         return None
+    days = mdates.datestr2num([r["period_start"] for r in rows]) + 0.5  # plot at midday
+    return (days, np.array([r["mean_score"] for r in rows]),
+            np.array([r["min_score"] for r in rows]), np.array([r["max_score"] for r in rows]))
+
+
+def generate_plant_score_chart(days=REPORT_DAYS, max_points=MAX_POINTS, output_path=None):
+    """Generate the plant score chart and return the file path.
+
+    Only scores from the last `days` days are plotted (all of them if
+    `days` is None). Short windows plot individual analyses, downsampled
+    to at most `max_points` points; longer ones plot the daily mean and
+    min/max range from the rollup tables. Either way render time and PNG
+    size don't grow with the history. Scores aren't kept per camera, so
+    with several cameras the chart combines all of them.
+    """
+    start = datetime.now() - timedelta(days=days) if days else None
+    score_range = None
+    if days and days <= RAW_MAX_DAYS:
+        rows = get_plant_score_series(start=start)
+        if not rows:
+            return None
+        series = np.asarray(rows, dtype=float)
+        offset = mdates.date2num(datetime(1970, 1, 1)) - JULIAN_UNIX_EPOCH
+        timestamps, plant_scores = lttb(series[:, 0] + offset, series[:, 1], max_points)
+    else:
+        daily = _daily_series(start)
+        if daily is None:
+            return None
+        timestamps, plant_scores, low, high = daily
+        score_range = (low, high)
+
+    # Object-oriented Agg API: no pyplot global state to set up or leak
+    fig = Figure(figsize=FIGSIZE, dpi=DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    marker = 'o' if len(timestamps) <= 60 else None
+    ax.plot(timestamps, plant_scores, marker=marker, linestyle='-', linewidth=2, markersize=5, color='#2ecc71')
+    if score_range is None:
+        ax.fill_between(timestamps, plant_scores, alpha=0.3, color='#2ecc71')
+    else:
+        ax.fill_between(timestamps, *score_range, alpha=0.3, color='#2ecc71', label='daily min-max')
+        ax.legend(loc='lower left')
 
-    plant_scores = [row[0] for row in rows]
-    timestamps = [datetime.fromisoformat(row[2]) for row in rows]
-    
-    # Create the plot
-    fig, ax = plt.subplots(figsize=(14, 7))
-    
-    ax.plot(timestamps, plant_scores, marker='o', linestyle='-', linewidth=2, markersize=6, color='#2ecc71')
-    ax.fill_between(timestamps, plant_scores, alpha=0.3, color='#2ecc71')
-    
     # Formatting
     ax.set_xlabel('Date', fontsize=12, fontweight='bold')
     ax.set_ylabel('Plant Score', fontsize=12, fontweight='bold')
-    ax.set_title('Plant Health Score Over Time', fontsize=14, fontweight='bold')
-    
+    title = f'Plant Health Score, last {days} days' if days else 'Plant Health Score Over Time'
+    ax.set_title(title, fontsize=14, fontweight='bold')
+
     # Format x-axis dates
+    ax.xaxis_date()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
     ax.xaxis.set_major_locator(mdates.AutoDateLocator())
-    plt.xticks(rotation=45, ha='right')
-    
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment('right')
+
     # Add grid
     ax.grid(True, alpha=0.3)
-    
-    # Tight layout
-    plt.tight_layout()
-    
+    fig.tight_layout()
+
     # Save the plot
-    base_dir = os.path.dirname(os.path.dirname(__file__))
-    output_path = os.path.join(base_dir, 'plant_score_chart.png')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    plt.close()
-    
+    if output_path is None:
+        output_path = os.path.join(BASE_DIR, 'plant_score_chart.png')
+    fig.savefig(output_path, dpi=DPI)
+
     return output_path
 
 def post_plant_score_to_discord():
     """Generate and post the plant score chart to Discord AI channel."""
-    chart_path = generate_plant_score_chart()
-    
+    with span("chart.render"):
+        chart_path = generate_plant_score_chart(days=REPORT_DAYS)
+
     if not chart_path:
         print("❌ No plant score data available")
         return
-    
-    webhook_url = get_ai_webhook_url()
-    if not webhook_url:
-        print("⚠️ AI webhook URL not configured. Cannot send chart.")
-        return
-    
+
     message = "📊 **Weekly Plant Health Report**\n\nHere's your plant's health score trend for this week!"
-    
-    try:
-        with open(chart_path, 'rb') as f:
-            files = {'file': f}
-            data = {'content': message}
-            response = requests.post(webhook_url, data=data, files=files, timeout=10)
-        
-        if response.ok:
-            print(f"✅ Plant score chart posted to Discord successfully")
-        else:
-            print(f"❌ Discord error: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"⚠️ Error posting to Discord: {e}")
+    weeks = get_plant_score_rollups("week", start=datetime.now() - timedelta(days=REPORT_DAYS))
+    week = weeks[-1] if weeks else None
+    if week and week["mean_score"] is not None:
+        message += (f"\nAverage {week['mean_score']:.0f} (range {week['min_score']:.0f}-{week['max_score']:.0f}) "
+                    f"over {week['analyses']} analyses since {week['period_start']}")
+    enqueue_message("ai", message, file_path=chart_path)
 
 if __name__ == "__main__":
     post_plant_score_to_discord()
@@ -0,0 +1,96 @@
+"""Downscaled copies of each photo for renderers and uploaders.
+
+Proxies at 1/2, 1/4 and 1/8 scale are written when a photo is captured,
+from the frame already in memory, and recorded in the photo_proxies
+table. Consumers ask for the smallest proxy that still covers the size
+they need, so decoding costs roughly 1/scale² of the full image.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from .config import get_settings
+from .database import get_photos_without_proxies, get_proxies, store_proxies
+
+PROXY_SCALES = (2, 4, 8)
+PROXY_QUALITY = 90
+
+
+def proxy_path(photo_id, scale):
+    return os.path.join(get_settings().proxies_dir, str(scale), f"{photo_id}.jpg")
+
+
+def write_proxies(photo_id, frame, frame_scale=1):
+    """Write and record the proxies of a decoded BGR `frame`.
+
+    `frame_scale` is how much `frame` is already reduced from the original
+    (e.g. 2 for an IMREAD_REDUCED_COLOR_2 decode). Each level is resized
+    from the previous one. Returns the stored rows.
+    """
+    height, width = frame.shape[:2]
+    width, height = width * frame_scale, height * frame_scale
+    rows = []
+    level = frame
+    for scale in PROXY_SCALES:
+        if scale < frame_scale:
+            continue
+        size = (max(1, width // scale), max(1, height // scale))
+        if (level.shape[1], level.shape[0]) != size:
+            level = cv2.resize(level, size, interpolation=cv2.INTER_AREA)
+        path = proxy_path(photo_id, scale)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not cv2.imwrite(path, level, [cv2.IMWRITE_JPEG_QUALITY, PROXY_QUALITY]):
+            raise RuntimeError(f"Could not write {path}")
+        rows.append((photo_id, scale, path, size[0], size[1]))
+    store_proxies(rows)
+    return rows
+
+
+def create_proxies(photo_id, photo_path):
+    """Create the proxies of a stored photo. Returns False if it can't be read."""
+    # The JPEG decoder can produce the 1/2 scale image directly
+    frame = cv2.imread(photo_path, cv2.IMREAD_REDUCED_COLOR_2)
+    if frame is None:
+        return False
+    write_proxies(photo_id, frame, frame_scale=2)
+    return True
+
+
+def backfill_proxies(workers=None, limit=None):
+    """Create proxies for every indexed photo that has none.
+
+    Returns a tuple of (created, failed).
+    """
+    photos = get_photos_without_proxies(limit)
+    if not photos:
+        return 0, 0
+    workers = max(1, workers or os.cpu_count() or 1)
+    print(f"Creating proxies for {len(photos)} photos with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda photo: create_proxies(photo["id"], photo["photo_path"]), photos))
+    created = sum(results)
+    return created, len(results) - created
+
+
+def pick_proxy(proxies, size):
+    """Return the path of the smallest proxy that covers `size`, or None.
+
+    `size` is a (width, height) bounding box. A proxy covers it when the
+    image fitted into the box would come out no larger than the proxy,
+    i.e. the proxy reaches the box in its limiting dimension.
+    """
+    if not proxies or not size:
+        return None
+    for _, path, width, height in proxies:  # smallest first
+        if min(size[0] / width, size[1] / height) <= 1 and os.path.exists(path):
+            return path
+    return None
+
+
+def proxy_paths(rows, size):
+    """Return each photo row's path, swapped for its smallest proxy covering `size`."""
+    if not size:
+        return [row["photo_path"] for row in rows]
+    proxies = get_proxies(row["id"] for row in rows)
+    return [pick_proxy(proxies.get(row["id"]), size) or row["photo_path"] for row in rows]
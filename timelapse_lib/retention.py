@@ -0,0 +1,144 @@
+"""Keep the photo archive from filling the disk.
+
+Retention works in small batches (RETENTION_BATCH photos), run after
+every capture and by --retention, so it never holds up the camera:
+
+1. Photos older than RETENTION_ARCHIVE_DAYS (30 by default, 0 disables)
+   are archived: the original is replaced by a half-scale JPEG at
+   ARCHIVE_QUALITY under the same path, so the index, analyses and
+   renders keep working unchanged.
+2. While free space is below RETENTION_MIN_FREE_GB, the oldest photos
+   not yet archived are archived regardless of age.
+3. If that still isn't enough, the oldest archived photos are deleted
+   with their signatures and proxies. Originals are never deleted
+   without being archived first. Their analyses are kept, so scores,
+   rollups and charts still cover them. Photos from the last
+   RETENTION_KEEP_DAYS days are never deleted.
+
+Only photos inside `photos/` are touched; files indexed in place by
+--ingest belong to the user and are left alone.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+import cv2
+
+from .config import get_settings
+from .database import (delete_photos, file_hash, get_oldest_photos, get_photos_to_archive,
+                       image_dimensions, store_archived_photo)
+from .disk_stats import get_free_space_gb
+
+# Archived copies are decoded at this reduction, straight from the JPEG
+ARCHIVE_SCALE = 2
+
+# Several capture threads (one per camera) may finish at once
+_running = threading.Lock()
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def archive_photo(photo, quality=None):
+    """Replace a photo's original with a half-scale, lower quality copy.
+
+    The copy is written next to the original and renamed over it; if that
+    already happened but the row wasn't updated (e.g. after a crash), the
+    row is just brought up to date. Unreadable files are recorded as
+    archived as they are, so they don't block every later batch.
+    Returns False if the file is missing.
+    """
+    path = photo["photo_path"]
+    if not os.path.exists(path):
+        return False
+    quality = get_settings().archive_quality if quality is None else quality
+
+    width, height = image_dimensions(path)
+    if not (photo["width"] and width and width < photo["width"]):
+        frame = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)
+        if frame is None:
+            print(f"⚠️ Could not read {path}; keeping it as is")
+            _remove(store_archived_photo(photo["id"], photo["file_size"], photo["width"], photo["height"],
+                                         photo["content_hash"], 0))
+            return True
+        root, ext = os.path.splitext(path)
+        tmp_path = f"{root}.archive{ext}"
+        if not cv2.imwrite(tmp_path, frame, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+            raise RuntimeError(f"Could not write {tmp_path}")
+        os.replace(tmp_path, path)
+        height, width = frame.shape[:2]
+
+    # Proxies at 1/2 scale are now the same size as the photo itself
+    stale = store_archived_photo(photo["id"], os.path.getsize(path), width, height,
+                                 file_hash(path), ARCHIVE_SCALE)
+    _remove(stale)
+    return True
+
+
+def free_space_gb():
+    """Return the free space where photos are stored, in gigabytes."""
+    photos_dir = get_settings().photos_dir
+    while not os.path.exists(photos_dir):
+        photos_dir = os.path.dirname(photos_dir)
+    return get_free_space_gb(photos_dir)
+
+
+def _archive_or_forget(photo, quality):
+    """Archive a photo, or drop its row if the file is gone. Returns True if archived."""
+    if archive_photo(photo, quality):
+        return True
+    delete_photos([photo["id"]])
+    return False
+
+
+def run_retention(batch_size=None):
+    """Run one bounded batch of retention work. Returns (archived, deleted).
+
+    Returns (0, 0) straight away if another thread is already running it.
+    """
+    if not _running.acquire(blocking=False):
+        return 0, 0
+    try:
+        return _run_retention(batch_size)
+    finally:
+        _running.release()
+
+
+def _run_retention(batch_size):
+    settings = get_settings()
+    budget = batch_size or settings.retention_batch
+    archived = deleted = 0
+
+    def low_on_space():
+        return settings.retention_min_free_gb > 0 and free_space_gb() < settings.retention_min_free_gb
+
+    if settings.retention_archive_days > 0:
+        before = datetime.now() - timedelta(days=settings.retention_archive_days)
+        for photo in get_photos_to_archive(before=before, limit=budget, under=settings.photos_dir):
+            archived += _archive_or_forget(photo, settings.archive_quality)
+            budget -= 1
+
+    while budget > 0 and low_on_space():
+        photos = get_photos_to_archive(limit=1, under=settings.photos_dir)
+        if not photos:
+            break
+        archived += _archive_or_forget(photos[0], settings.archive_quality)
+        budget -= 1
+
+    keep_after = datetime.now() - timedelta(days=settings.retention_keep_days)
+    while budget > 0 and low_on_space():
+        photos = get_oldest_photos(1, before=keep_after, under=settings.photos_dir, archived=True)
+        if not photos:
+            print(f"⚠️ Less than {settings.retention_min_free_gb} GB free and nothing left to delete")
+            break
+        delete_photos([photos[0]["id"]], keep_analyses=True)
+        _remove([photos[0]["photo_path"]])
+        deleted += 1
+        budget -= 1
+
+    return archived, deleted
@@ -0,0 +1,288 @@
+"""Run every periodic job from one long-lived process.
+
+Replaces the per-job cron entries and the root `scheduler.py` polling
+loop. Jobs sit in a heap ordered by their next deadline and the loop
+sleeps until the earliest one (or until a running job finishes), so an
+idle scheduler never wakes up. Due jobs run on worker threads, and each
+declares the resources it needs ("camera", "photos", "network"): a job
+whose resources are in use waits until they're released, and a job
+still running when it comes due again runs once more afterwards rather
+than twice at once. The database isn't a resource: every job writes to
+it, and WAL mode with a busy timeout (see database._connect) already
+serialises writers without making a capture wait for a render.
+
+The camera, database connections, Gemini client and HTTP sessions stay
+warm between jobs. The start of each job's latest run is stored in the
+job_runs table, so after a restart a job that missed its slot runs once
+straight away.
+"""
+import heapq
+import itertools
+import shutil
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .config import camera_series, get_capture_devices, get_settings
+from .database import get_job_runs, store_job_run
+from .metrics import flush as flush_metrics, span
+
+# How often retention checks the disk and archives a batch
+RETENTION_INTERVAL = 600
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class Every:
+    """Run every `setting` seconds (read live from the settings); first run at start."""
+
+    def __init__(self, setting=None, seconds=None):
+        self.setting = setting
+        self.seconds = seconds
+
+    def _interval(self):
+        return self.seconds if self.setting is None else getattr(get_settings(), self.setting)
+
+    def first(self, now):
+        return now if self._interval() > 0 else None
+
+    def next_after(self, when):
+        interval = self._interval()
+        return when + timedelta(seconds=interval) if interval > 0 else None
+
+
+class Weekly:
+    """Run once a week at the time in `setting`, e.g. "sat 12:00" ("off" disables)."""
+
+    def __init__(self, setting):
+        self.setting = setting
+
+    def _slot(self):
+        value = getattr(get_settings(), self.setting).strip().lower()
+        if value in ("", "off"):
+            return None
+        day, at = value.split()
+        hour, minute = (int(v) for v in at.split(":"))
+        return WEEKDAYS.index(day[:3]), hour, minute
+
+    def first(self, now):
+        return self.next_after(now)
+
+    def next_after(self, when):
+        slot = self._slot()
+        if slot is None:
+            return None
+        weekday, hour, minute = slot
+        candidate = when.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        candidate += timedelta(days=(weekday - when.weekday()) % 7)
+        if candidate <= when:
+            candidate += timedelta(days=7)
+        return candidate
+
+
+class Job:
+    """A named callable, its schedule, the resources it holds while running
+    and an optional `close` called when the scheduler stops."""
+
+    def __init__(self, name, run, schedule, resources=(), close=None):
+        self.name = name
+        self.run = run
+        self.schedule = schedule
+        self.resources = frozenset(resources)
+        self.close = close
+
+
+def default_jobs(on_capture=None):
+    """Return the standard jobs. `on_capture(path)` is called after each photo."""
+    from .capture import CameraSession
+
+    devices = get_capture_devices()
+    cameras = [CameraSession(device) for device in devices]
+    # Every camera is read at once, each on its own thread
+    camera_pool = ThreadPoolExecutor(max_workers=len(cameras), thread_name_prefix="camera")
+
+    def capture():
+        futures = [camera_pool.submit(camera.capture) for camera in cameras]
+        failed = 0
+        for camera, future in zip(cameras, futures):
+            try:
+                path = future.result()
+            except Exception as e:
+                print(f"⚠️ Camera {camera.device} failed: {e}")
+                failed += 1
+                continue
+            print(f"📸 Captured {path}")
+            if on_capture:
+                on_capture(path)
+        if failed == len(cameras):
+            raise RuntimeError("No camera could capture")
+
+    def close_cameras():
+        camera_pool.shutdown(wait=True)
+        for camera in cameras:
+            camera.close()
+
+    def ai_batch():
+        from .gemini import analyse_pending
+        # Bounded, so a backlog (e.g. after --ingest) is spread over many runs
+        succeeded, failed = analyse_pending(limit=get_settings().ai_batch_limit or None)
+        if succeeded or failed:
+            print(f"🤖 Analysed {succeeded} photos ({failed} failed)")
+
+    warned_ffmpeg = False
+
+    def render():
+        nonlocal warned_ffmpeg
+        from .incremental import render_gif_incremental, render_webm_incremental
+        renders = [("gif", render_gif_incremental)]
+        if shutil.which("ffmpeg"):
+            renders.append(("webm", render_webm_incremental))
+        elif not warned_ffmpeg:
+            print("⚠️ ffmpeg not found; skipping WebM renders")
+            warned_ffmpeg = True
+
+        failed = 0
+        for device in devices:
+            camera = camera_series(device)
+            for kind, render_one in renders:
+                try:
+                    with span(f"render.{kind}"):
+                        render_one(camera=camera)
+                except ValueError as e:
+                    # e.g. no usable frames yet from a newly added camera
+                    print(f"⚠️ Camera {device}: {e}")
+                except Exception:
+                    # Keep going, so one camera can't hold up the others
+                    print(f"❌ Camera {device} {kind} render failed:\n{traceback.format_exc()}")
+                    failed += 1
+        if failed:
+            raise RuntimeError(f"{failed} renders failed")
+
+    def retention():
+        from .retention import run_retention
+        archived, deleted = run_retention()
+        if archived or deleted:
+            print(f"🗄️ Retention: archived {archived}, deleted {deleted} photos")
+
+    def weekly_report():
+        from .post_plant_score import post_plant_score_to_discord
+        print("📊 Posting weekly plant score report to Discord...")
+        post_plant_score_to_discord()
+
+    jobs = [
+        Job("capture", capture, Every("capture_interval"), resources=("camera",), close=close_cameras),
+        Job("ai_batch", ai_batch, Every("ai_batch_interval"), resources=("network",)),
+        # Retention rewrites and deletes the photo files renders read
+        Job("render", render, Every("render_interval"), resources=("photos",)),
+        Job("retention", retention, Every(seconds=RETENTION_INTERVAL), resources=("photos",)),
+        Job("weekly_report", weekly_report, Weekly("weekly_report_at"), resources=("network",)),
+    ]
+    return jobs
+
+
+class Scheduler:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._heap = []
+        self._blocked = []  # due, but waiting for a resource or their previous run
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._busy = set()
+        self._running = set()
+        self._pool = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="job")
+
+    def _push(self, due, job):
+        if due is not None:
+            heapq.heappush(self._heap, (due, next(self._order), job))
+
+    def _load(self, now):
+        """Queue each job for its next run, catching up any that were missed."""
+        runs = get_job_runs()
+        for job in self.jobs:
+            last = runs.get(job.name)
+            if last is None:
+                due = job.schedule.first(now)
+            else:
+                due = job.schedule.next_after(datetime.fromisoformat(str(last["started_at"])))
+            if due is not None and due < now:
+                print(f"⏰ {job.name} missed its {due:%Y-%m-%d %H:%M} run; running it now")
+                due = now
+            self._push(due, job)
+            if due is not None:
+                print(f"🗓️ {job.name}: next run {due:%Y-%m-%d %H:%M:%S}")
+
+    def _start(self, job):
+        self._busy |= job.resources
+        self._running.add(job.name)
+        self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        started = datetime.now()
+        ok, error = True, None
+        try:
+            with span(f"job.{job.name}"):
+                job.run()
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+            print(f"❌ Job {job.name} failed:\n{traceback.format_exc()}")
+        try:
+            store_job_run(job.name, started, datetime.now(), ok, error)
+        except Exception as e:
+            print(f"⚠️ Could not record run of {job.name}: {e}")
+        flush_metrics()
+        with self._lock:
+            self._busy -= job.resources
+            self._running.discard(job.name)
+        self._wakeup.set()
+
+    def _dispatch(self, now):
+        """Start every due job that can run now. Returns seconds until the next deadline."""
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                # Schedule the next run from this slot, or from now if we fell
+                # behind, so a late job doesn't burst to catch up
+                next_due = job.schedule.next_after(due)
+                if next_due is not None and next_due <= now:
+                    next_due = job.schedule.next_after(now)
+                self._push(next_due, job)
+                if job not in self._blocked:
+                    self._blocked.append(job)
+
+            for job in list(self._blocked):
+                if job.name not in self._running and not (job.resources & self._busy):
+                    self._blocked.remove(job)
+                    self._start(job)
+
+            if not self._heap:
+                return None
+            return max(0.0, (self._heap[0][0] - now).total_seconds())
+
+    def stop(self):
+        """Ask run() to return once running jobs finish. Safe from any thread."""
+        self._stop.set()
+        self._wakeup.set()
+
+    def run(self):
+        """Run until stop() is called or the process is interrupted."""
+        self._load(datetime.now())
+        try:
+            while not self._stop.is_set():
+                timeout = self._dispatch(datetime.now())
+                # Sleep until the next deadline; a finishing job wakes us early
+                # so anything waiting on its resources can start
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+        finally:
+            self._stop.set()
+            self._pool.shutdown(wait=True)
+            for job in self.jobs:
+                if job.close:
+                    job.close()
+
+
+def run_scheduler(jobs=None):
+    """Run `jobs` (default: default_jobs()) until interrupted."""
+    Scheduler(jobs if jobs is not None else default_jobs()).run()
@@ -0,0 +1,114 @@
+"""Date-sharded photo storage.
+
+Photos live in `photos/YYYY/MM/DD/` so no directory grows past a day's
+worth of captures; each additional camera has its own series under
+`photos/cam<N>/YYYY/MM/DD/`. migrate_to_sharded() moves photos from the old flat
+layout while the capture daemon keeps running: each batch of files is
+renamed and its `photos.photo_path` rows updated in one transaction, and
+the renames are undone if the transaction fails. Flat files that were
+never indexed are indexed first, so they move too.
+"""
+import os
+
+from .config import get_settings
+from .database import IMAGE_EXTENSIONS, get_db, get_indexed_paths, store_photo
+
+
+def camera_suffix(camera):
+    """Return the suffix naming `camera`'s outputs: "" for camera 0, else "_cam<N>"."""
+    return f"_cam{camera}" if camera else ""
+
+
+def shard_dir(captured_at, photos_dir=None, camera=0):
+    """Return the `YYYY/MM/DD` directory for a capture time (datetime or ISO string)."""
+    day = str(captured_at)[:10]
+    year, month, date = day.split("-")
+    base = photos_dir or get_settings().photos_dir
+    if camera:
+        base = os.path.join(base, f"cam{camera}")
+    return os.path.join(base, year, month, date)
+
+
+def _flat_photos(conn, photos_dir, after_id, limit):
+    """Return up to `limit` (id, photo_path, captured_at) rows stored directly
+    in `photos_dir`, with ids above `after_id`, in id order."""
+    prefix = photos_dir.rstrip(os.sep) + os.sep
+    return conn.execute(
+        """SELECT id, photo_path, captured_at FROM photos
+           WHERE id > ? AND substr(photo_path, 1, length(?)) = ?
+             AND instr(substr(photo_path, length(?) + 1), ?) = 0
+           ORDER BY id LIMIT ?""",
+        (after_id, prefix, prefix, prefix, os.sep, limit),
+    ).fetchall()
+
+
+def _index_flat_files(photos_dir):
+    """Index image files stored directly in `photos_dir` that have no row yet.
+
+    Returns the number of files indexed.
+    """
+    try:
+        with os.scandir(photos_dir) as entries:
+            paths = [entry.path for entry in entries
+                     if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+    except FileNotFoundError:
+        return 0
+    indexed = get_indexed_paths()
+    added = 0
+    for path in sorted(paths):
+        if path not in indexed:
+            store_photo(path)
+            added += 1
+    if added:
+        print(f"Indexed {added} photos that were missing from the database")
+    return added
+
+
+def migrate_to_sharded(batch_size=500):
+    """Move photos from `photos/` into `photos/YYYY/MM/DD/`.
+
+    Files without a row are indexed first, taking their capture time from
+    the filename (or now). Safe to interrupt and re-run: a photo whose file was moved but whose
+    row wasn't updated (e.g. after a crash) is picked up and fixed.
+    Returns a tuple of (moved, skipped).
+    """
+    photos_dir = os.path.abspath(get_settings().photos_dir)
+    _index_flat_files(photos_dir)
+    conn = get_db()
+    moved = skipped = 0
+    last_id = 0
+    while True:
+        # Walk the table by id, so each batch starts where the last one ended
+        batch = _flat_photos(conn, photos_dir, last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["id"]
+
+        renamed = []
+        try:
+            with conn:
+                for row in batch:
+                    src = row["photo_path"]
+                    dst = os.path.join(shard_dir(row["captured_at"], photos_dir), os.path.basename(src))
+                    if os.path.exists(src):
+                        if os.path.exists(dst):
+                            print(f"⚠️ {dst} already exists; leaving {src} in place")
+                            skipped += 1
+                            continue
+                        os.makedirs(os.path.dirname(dst), exist_ok=True)
+                        os.rename(src, dst)
+                        renamed.append((src, dst))
+                    elif not os.path.exists(dst):
+                        # Missing file; --reconcile deals with those
+                        skipped += 1
+                        continue
+                    conn.execute("UPDATE photos SET photo_path = ? WHERE id = ?", (dst, row["id"]))
+                    moved += 1
+        except Exception:
+            # The rows were rolled back, so put the files back where they say
+            for src, dst in reversed(renamed):
+                os.rename(dst, src)
+            raise
+        if renamed:
+            print(f"Moved {moved} photos so far")
+    return moved, skipped